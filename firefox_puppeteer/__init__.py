@@ -6,6 +6,7 @@ import os
 
 from marionette import HTMLElement
 
+from .context import track_context
 from .decorators import use_class_as_property
 
 
@@ -29,6 +30,7 @@ class Puppeteer(object):
         return self.marionette
 
     def set_marionette(self, marionette):
+        track_context(marionette)
         self.marionette = marionette
 
     @use_class_as_property('api.appinfo.AppInfo')
@@ -2,6 +2,8 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
+from .context import track_context
+
 
 class BaseLib(object):
     """A trivial base class that handles lazily setting the "client" class
@@ -18,6 +20,7 @@ class BaseLib(object):
     def marionette(self):
         if self._marionette is None:
             self._marionette = self._marionette_getter()
+            track_context(self._marionette)
         return self._marionette
 
     def get_marionette(self):
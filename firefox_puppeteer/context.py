@@ -0,0 +1,77 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import weakref
+from contextlib import contextmanager
+from functools import wraps
+
+
+# Maps each tracked Marionette instance to its :class:`ContextTracker`
+_trackers = weakref.WeakKeyDictionary()
+
+
+class ContextTracker(object):
+    """Remembers the context a Marionette session is in."""
+
+    def __init__(self):
+        self.session_id = None
+        self.context = None
+
+    def get(self, marionette):
+        """Returns the context of the current session, or `None` if unknown."""
+        if self.session_id != marionette.session_id:
+            return None
+        return self.context
+
+    def set(self, marionette, context):
+        self.session_id = marionette.session_id
+        self.context = context
+
+
+def track_context(marionette):
+    """Lets the given Marionette instance keep track of its context, so that
+    `using_context` only sends commands when the context has to be changed.
+
+    Without tracking, each `using_context` block retrieves the context on
+    entry, and sets it twice, even if the session is in the requested
+    context already.
+
+    The context has to be changed via `set_context` or `using_context` of
+    the Marionette instance. Calling this function again for the same
+    instance has no effect.
+
+    :param marionette: The Marionette instance to track the context of
+    """
+    if marionette is None or marionette in _trackers:
+        return
+
+    tracker = _trackers[marionette] = ContextTracker()
+    set_context = marionette.set_context
+
+    # Private names, so that commands get attributed to the calling API
+    @wraps(set_context)
+    def _set_context(context):
+        response = set_context(context)
+        tracker.set(marionette, context)
+        return response
+
+    @wraps(marionette.using_context)
+    @contextmanager
+    def _using_context(context):
+        scope = tracker.get(marionette)
+        if scope is None:
+            scope = marionette._send_message('getContext', 'value')
+            tracker.set(marionette, scope)
+
+        if context != scope:
+            _set_context(context)
+        try:
+            yield
+        finally:
+            # The context could also have been changed within the block
+            if tracker.get(marionette) != scope:
+                _set_context(scope)
+
+    marionette.set_context = _set_context
+    marionette.using_context = _using_context
@@ -0,0 +1,57 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from firefox_ui_harness.testcase import FirefoxTestCase
+
+
+class TestContext(FirefoxTestCase):
+
+    def get_context(self):
+        return self.marionette._send_message('getContext', 'value')
+
+    def test_using_context(self):
+        self.assertEqual(self.get_context(), 'chrome')
+
+        with self.marionette.using_context('content'):
+            self.assertEqual(self.get_context(), 'content')
+
+            with self.marionette.using_context('chrome'):
+                self.assertEqual(self.get_context(), 'chrome')
+
+            self.assertEqual(self.get_context(), 'content')
+
+        self.assertEqual(self.get_context(), 'chrome')
+
+    def test_set_context_within_block(self):
+        with self.marionette.using_context('chrome'):
+            self.marionette.set_context('content')
+            self.assertEqual(self.get_context(), 'content')
+
+        self.assertEqual(self.get_context(), 'chrome')
+
+    def test_redundant_commands_skipped(self):
+        # Let the context be known first
+        with self.marionette.using_context('chrome'):
+            pass
+
+        commands = []
+        send_message = self.marionette._send_message
+
+        def record_message(name, *args, **kwargs):
+            commands.append(name)
+            return send_message(name, *args, **kwargs)
+
+        self.marionette._send_message = record_message
+        try:
+            with self.marionette.using_context('chrome'):
+                with self.marionette.using_context('chrome'):
+                    pass
+            self.assertEqual(commands, [])
+
+            with self.marionette.using_context('content'):
+                with self.marionette.using_context('content'):
+                    pass
+            self.assertEqual(commands, ['setContext', 'setContext'])
+        finally:
+            del self.marionette._send_message
@@ -19,6 +19,34 @@ class TestMenuBar(FirefoxTestCase):
         self.assertEquals(len(self.browser.tabbar.tabs), num_tabs + 1)
         self.browser.tabbar.tabs[-1].close()
 
+    def test_select_by_id(self):
+        num_tabs = len(self.browser.tabbar.tabs)
+        self.browser.menubar.select_by_id('menu_newNavigatorTab')
+        self.assertEquals(len(self.browser.tabbar.tabs), num_tabs + 1)
+        self.browser.tabbar.tabs[-1].close()
+
+        with self.assertRaises(NoSuchElementException):
+            self.browser.menubar.select_by_id('foobar')
+
+    def test_select_by_command(self):
+        num_tabs = len(self.browser.tabbar.tabs)
+        self.browser.menubar.select_by_id('menu_newNavigatorTab', trigger='command')
+        self.assertEquals(len(self.browser.tabbar.tabs), num_tabs + 1)
+        self.browser.tabbar.tabs[-1].close()
+
+    def test_snapshot(self):
+        menus = self.browser.menubar.snapshot()
+        self.assertEqual(len(menus), len(self.browser.menubar.menus))
+
+        # Hard-coded labels will not work in localized builds
+        file_menu = [menu for menu in menus if menu.label == 'File'][0]
+        self.assertEqual(file_menu.element, self.browser.menubar.get_menu('File'))
+
+        item = [item for item in file_menu.items if item.id == 'menu_newNavigatorTab'][0]
+        self.assertEqual(item.label, 'New Tab')
+        self.assertFalse(item.disabled)
+        self.assertIn(item.element, self.browser.menubar.get_menu('File').items)
+
     def test_click_non_existent_menu_and_item(self):
         with self.assertRaises(NoSuchElementException):
             # Hard-coded labels will not work in localized builds
@@ -2,9 +2,10 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from marionette import Wait
 from marionette.errors import NoSuchElementException
 
+import firefox_puppeteer.errors as errors
+
 from firefox_ui_harness.testcase import FirefoxTestCase
 
 
@@ -25,30 +26,13 @@ class TestTabs(FirefoxTestCase):
         ]
         urls = [self.marionette.absolute_url(url) for url in urls]
 
-        self.marionette.execute_script("""
-            for (let i = 0; i < arguments.length; ++i) {
-                gBrowser.addTab(arguments[i]);
-            }
-        """, script_args=urls)
+        self.browser.tabbar.open_tabs(urls)
 
         self.prefs.set_pref('browser.tabs.warnOnClose', False)
         self.prefs.set_pref('browser.tabs.warnOnCloseOtherTabs', False)
 
-        def tabs_loaded(m):
-            label = m.execute_script("""
-              return gBrowser.tabs[gBrowser.tabs.length-1]
-                             .getAttribute('label');
-            """)
-            return 'Projects' in label
-
-        Wait(self.marionette).until(tabs_loaded)
-
     def tearDown(self):
-        self.marionette.execute_script("""
-            gBrowser.removeAllTabsBut(gBrowser.tabs[0]);
-        """)
-
-        self.wait_for_condition(lambda _: len(self.browser.tabbar.tabs) == 1)
+        self.browser.tabbar.close_tabs(lambda info: info.index > 0)
 
         FirefoxTestCase.tearDown(self)
 
@@ -77,3 +61,69 @@ class TestTabs(FirefoxTestCase):
         num_tabs = len(self.browser.tabbar.tabs)
         self.browser.tabbar.newtab_button.click()
         self.assertEquals(len(self.browser.tabbar.tabs), num_tabs + 1)
+
+    def test_open_tab(self):
+        num_tabs = len(self.browser.tabbar.tabs)
+
+        for trigger in ('button', 'menu'):
+            tab = self.browser.tabbar.open_tab(trigger=trigger)
+            self.assertEqual(tab, self.browser.tabbar.active_tab)
+            self.assertEqual(len(self.browser.tabbar.tabs), num_tabs + 1)
+
+            tab.close()
+            self.assertEqual(len(self.browser.tabbar.tabs), num_tabs)
+
+    def test_open_tab_removes_listener_on_failure(self):
+        def opener(tabbar):
+            raise errors.InvalidValueError('Failed to open the tab')
+
+        self.assertRaises(errors.InvalidValueError,
+                          self.browser.tabbar.open_tab, trigger=opener)
+        self.assertRaises(errors.InvalidValueError,
+                          self.browser.tabbar.open_tab, trigger='foo')
+
+        with self.marionette.using_context('chrome'):
+            listeners = self.marionette.execute_script("""
+              return Object.keys(window.puppeteerTabListeners || {});
+            """)
+        self.assertEqual(listeners, [])
+
+    def test_snapshot(self):
+        self.browser.tabbar.switch_to_tab(3)
+
+        infos = self.browser.tabbar.snapshot()
+        self.assertEqual([info.index for info in infos], range(9))
+        self.assertEqual([info.tab for info in infos], self.browser.tabbar.tabs)
+
+        self.assertTrue(infos[3].selected)
+        self.assertFalse(infos[6].selected)
+        self.assertFalse(infos[6].pinned)
+        self.assertIn('Mission', infos[6].label)
+        self.assertEqual(infos[6].url,
+                         self.marionette.absolute_url('layout/mozilla_mission.html'))
+
+    def test_open_close_tabs(self):
+        num_tabs = len(self.browser.tabbar.tabs)
+        urls = [self.marionette.absolute_url('layout/mozilla.html')] * 3
+
+        tabs = self.browser.tabbar.open_tabs(urls)
+        self.assertEqual(self.browser.tabbar.tabs[-3:], tabs)
+
+        self.browser.tabbar.close_tabs(range(num_tabs, num_tabs + 3))
+        self.assertEqual(len(self.browser.tabbar.tabs), num_tabs)
+
+
+class TestMenuPanel(FirefoxTestCase):
+
+    def test_button_index(self):
+        menupanel = self.browser.tabbar.menupanel
+        self.assertIs(self.browser.tabbar.menupanel, menupanel)
+
+        button_index = menupanel.button_index
+        info = button_index['new-window-button']
+        self.assertIs(button_index[info.label], info)
+        self.assertFalse(info.disabled)
+
+        buttons = menupanel.popup.buttons
+        self.assertIn(info.button, buttons)
+        self.assertEqual(len(buttons), len(set(button_index.values())))
@@ -2,6 +2,7 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+from marionette import Wait
 from marionette.errors import NoSuchElementException
 
 from firefox_ui_harness.decorators import skip_under_xvfb
@@ -11,12 +12,12 @@ from firefox_ui_harness.testcase import FirefoxTestCase
 class TestLocationBar(FirefoxTestCase):
 
     def test_reload(self):
-        event_types = ["shortcut", "shortcut2", "button"]
+        locationbar = self.browser.navbar.locationbar
+        event_types = ["shortcut", "shortcut2", "button", "command"]
         for event in event_types:
-            # TODO: Until we have waitForPageLoad, this only tests API
-            # compatibility.
-            self.browser.navbar.locationbar.reload_url(event, force=True)
-            self.browser.navbar.locationbar.reload_url(event, force=False)
+            for force in (True, False):
+                self.browser.tabbar.wait_for_page_load(
+                    lambda tabbar: locationbar.reload_url(event, force=force))
 
     def test_focus_and_clear(self):
         locationbar = self.browser.navbar.locationbar
@@ -31,10 +32,14 @@ class TestLocationBar(FirefoxTestCase):
     def test_load_url(self):
         data_uri = 'data:text/html,<title>Title</title>'
         locationbar = self.browser.navbar.locationbar
-        locationbar.load_url(data_uri)
+        self.assertEqual(locationbar.load_url(data_uri), data_uri)
 
         with self.marionette.using_context('content'):
-            self.wait_for_condition(lambda mn: mn.get_url() == data_uri)
+            self.assertEqual(self.marionette.get_url(), data_uri)
+
+        # Changing the hash doesn't load a page
+        self.assertIsNone(locationbar.load_url(data_uri + '#hash', wait=False))
+        Wait(self.marionette).until(lambda _: locationbar.value == data_uri + '#hash')
 
     def test_urlbar_input(self):
         urlbar_input = self.browser.navbar.locationbar.urlbar_input
@@ -3,7 +3,7 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 from marionette import By
-from marionette.errors import NoSuchWindowException
+from marionette.errors import NoSuchElementException, NoSuchWindowException
 
 import firefox_puppeteer.errors as errors
 
@@ -45,17 +45,84 @@ class TestWindows(FirefoxTestCase):
 
         self.windows.switch_to(find_by_url)
 
+        # Find the 2nd window again by the URL of its snapshot
+        self.windows.switch_to(windows[2].handle)
+        window = self.windows.switch_to(lambda info: info.url == url, snapshot=True)
+        self.assertEquals(windows[1].handle, window.handle)
+        self.assertEquals(windows[1].handle, self.marionette.current_chrome_window_handle)
+
         # Switching to an unknown handles has to fail
         self.assertRaises(NoSuchWindowException,
                           self.windows.switch_to, "humbug")
         self.assertRaises(NoSuchWindowException,
                           self.windows.switch_to, lambda win: False)
+        self.assertRaises(NoSuchWindowException,
+                          self.windows.switch_to, lambda info: False, snapshot=True)
 
-        self.windows.close_all(self.browser)
+        self.assertEqual(self.windows.close_all(self.browser), [])
         self.browser.switch_to()
 
         self.assertEqual(len(self.windows.all), 1)
 
+    def test_windows_snapshot(self):
+        win2 = self.browser.open_browser(is_private=True)
+
+        infos = self.windows.snapshot()
+        self.assertEqual(set(info.handle for info in infos),
+                         set(self.marionette.chrome_window_handles))
+
+        info1, info2 = [dict((info.handle, info) for info in infos)[handle]
+                        for handle in (self.browser.handle, win2.handle)]
+        self.assertEqual(info1.window_type, 'navigator:browser')
+        self.assertFalse(info1.is_private)
+        self.assertFalse(info1.focused)
+        self.assertTrue(info2.is_private)
+        self.assertTrue(info2.focused)
+        self.assertEqual(info2.tab_count, 1)
+
+        win2.close()
+
+    def test_window_identity(self):
+        self.assertIs(self.windows.current, self.browser)
+        self.assertIs(self.windows.current.tabbar, self.browser.tabbar)
+
+        win2 = self.browser.open_browser()
+        self.assertIs(self.windows.current, win2)
+        self.assertIs(self.windows.switch_to(self.browser.handle), self.browser)
+        self.assertIs(self.windows.switch_to(win2.handle), win2)
+
+        win2.close()
+        self.assertNotIn(win2.handle, [win.handle for win in self.windows.all])
+
+    def test_switch_to_after_direct_switch(self):
+        win2 = self.browser.open_browser()
+        self.assertIs(self.windows.current, win2)
+
+        # Switching windows via Marionette directly has to be noticed
+        self.marionette.switch_to_window(self.browser.handle)
+        self.assertIs(self.windows.current, self.browser)
+
+        win2.switch_to()
+        self.assertEqual(self.marionette.current_chrome_window_handle, win2.handle)
+
+        win2.close()
+
+    def test_switch_to_after_direct_close(self):
+        win2 = self.browser.open_browser()
+        self.windows.switch_to(self.browser.handle)
+        self.windows.switch_to(win2.handle)
+
+        # Windows closed by scripts or directly via Marionette have to be noticed
+        self.marionette.execute_script(""" window.close(); """)
+        self.assertRaises(NoSuchWindowException, getattr, self.windows, 'current')
+        self.assertRaises(NoSuchWindowException, self.windows.switch_to, win2.handle)
+        self.windows.switch_to(self.browser.handle)
+
+        win3 = self.browser.open_browser()
+        self.marionette.close_chrome_window()
+        self.assertRaises(NoSuchWindowException, self.windows.switch_to, win3.handle)
+        self.windows.switch_to(self.browser.handle)
+
     def test_base_window_basics(self):
         # force BaseWindow instance
         win1 = BaseWindow(lambda: self.marionette, self.browser.handle)
@@ -76,6 +143,10 @@ class TestWindows(FirefoxTestCase):
         self.assertRaises(KeyError,
                           win1.send_shortcut, 'l', acel=True)
 
+        # Test unknown commands
+        self.assertRaises(NoSuchElementException,
+                          win1.do_command, 'cmd_unknown')
+
     def test_base_window_open_close(self):
         # force BaseWindow instance
         win1 = BaseWindow(lambda: self.marionette, self.browser.handle)
@@ -94,7 +165,7 @@ class TestWindows(FirefoxTestCase):
 
         self.assertTrue(win2.closed)
         self.assertEquals(len(self.marionette.chrome_window_handles), 1)
-        self.assertEquals(win2.handle, self.marionette.current_chrome_window_handle)
+        self.assertEquals(win1.handle, self.marionette.current_chrome_window_handle)
         self.assertTrue(win1.focused)
 
         win1.switch_to()
@@ -121,6 +192,38 @@ class TestWindows(FirefoxTestCase):
                           win1.open_window, expected_window_class=BaseWindow)
         self.windows.close_all([win1.handle])
 
+    def test_close_switches_to_focused_window(self):
+        win2 = self.browser.open_browser()
+        win3 = self.browser.open_browser()
+
+        # The window which gets the focus is not the first remaining one
+        win2.focus()
+        win3.focus()
+        win3.close()
+
+        focused_handle = self.windows.focused_chrome_window_handle
+        self.assertNotEqual(focused_handle, self.browser.handle)
+        self.assertEqual(self.marionette.current_chrome_window_handle, focused_handle)
+        self.assertIs(self.windows.current, self.windows.create_window_instance(focused_handle))
+
+        win2.close()
+
+    def test_open_window_removes_listener_on_failure(self):
+        def opener(window):
+            raise errors.InvalidValueError('Failed to open the window')
+
+        self.assertRaises(errors.InvalidValueError,
+                          self.browser.open_window, callback=opener)
+
+        with self.marionette.using_context('chrome'):
+            listeners = self.marionette.execute_script("""
+              Cu.import("resource://gre/modules/Services.jsm");
+
+              let listeners = Services.appShell.hiddenDOMWindow.puppeteerWindowListeners;
+              return Object.keys(listeners || {});
+            """)
+        self.assertEqual(listeners, [])
+
     def test_base_window_switch_to_and_focus(self):
         # force BaseWindow instance
         win1 = BaseWindow(lambda: self.marionette, self.browser.handle)
@@ -194,6 +297,18 @@ class TestWindows(FirefoxTestCase):
         self.assertTrue(win2.is_private)
         win2.close()
 
+        # open and close a new browser window by firing the command
+        win2 = self.browser.open_browser(trigger='command')
+        self.assertEquals(win2, self.windows.current)
+        self.assertFalse(win2.is_private)
+        win2.close(trigger='command')
+
+        # open and close a new private browsing window by firing the command
+        win2 = self.browser.open_browser(trigger='command', is_private=True)
+        self.assertEquals(win2, self.windows.current)
+        self.assertTrue(win2.is_private)
+        win2.close(trigger='command')
+
         # force closing a window
         win2 = self.browser.open_browser()
         self.assertEquals(win2, self.windows.current)
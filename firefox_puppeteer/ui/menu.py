@@ -5,6 +5,8 @@
 
 from marionette.errors import NoSuchElementException
 
+import firefox_puppeteer.errors as errors
+
 from ..base import BaseLib
 from .. import DOMElement
 
@@ -12,17 +14,30 @@ from .. import DOMElement
 class MenuBar(BaseLib):
     """
     Class for manipulating the Firefox menubar.
+
+    The menus and their items are retrieved at once and cached. They only get
+    retrieved again once a menu has been shown, because menus like History or
+    Bookmarks rebuild their items when they are opened.
     """
 
+    def __init__(self, marionette_getter):
+        BaseLib.__init__(self, marionette_getter)
+
+        # Number of times a menu had been shown when the menus have been
+        # retrieved, and the menus in order, the menus by label and the items by id
+        self._generation = None
+        self._menus = []
+        self._menus_by_label = {}
+        self._items_by_id = {}
+
     @property
     def menus(self):
         """
         :returns: A list of :class:`MenuElement`'s corresponding to the top
                   level menus in the menubar.
         """
-        menus = (self.marionette.find_element('id', 'main-menubar')
-                                .find_elements('tag name', 'menu'))
-        return [self.MenuElement(menu) for menu in menus]
+        self._update_menus()
+        return [self._create_menu_element(info) for info in self._menus]
 
     def get_menu(self, label):
         """
@@ -31,47 +46,203 @@ class MenuBar(BaseLib):
         :param label: The label of the menu, e.g 'File' or 'View'
         :returns: A MenuElement
         """
-        menu = [m for m in self.menus if m.get_attribute('label') == label]
+        return self._create_menu_element(self._get_menu_info(label))
 
-        if not menu:
-            raise NoSuchElementException('Could not find a menu with '
-                                         'label "{}"'.format(label))
-
-        return menu[0]
-
-    def select(self, label, item):
+    def select(self, label, item, trigger='click'):
         """
         Select an item in a menu.
 
         :param label: The label of the menu, e.g 'File' or 'View'
         :param item: The label of the item in the menu, e.g 'New Tab'
+        :param trigger: Optional, how to select the item. One of 'click', or
+         'command' to directly fire the command of the item. Defaults to 'click'.
         """
-        return self.get_menu(label).select(item)
+        info = self._get_item_info(self._get_menu_info(label), item)
+        return self._select_item(info, trigger)
+
+    def select_by_id(self, item_id, trigger='click'):
+        """
+        Select an item in any of the menus.
+
+        :param item_id: The id of the menuitem, e.g 'menu_newNavigatorTab'
+        :param trigger: Optional, how to select the item. One of 'click', or
+         'command' to directly fire the command of the item. Defaults to 'click'.
+        """
+        self._update_menus()
+        info = self._items_by_id.get(item_id)
+        if info is None:
+            raise NoSuchElementException('Could not find a menuitem with '
+                                         'id "{}"'.format(item_id))
+
+        return self._select_item(info, trigger)
+
+    def snapshot(self):
+        """Retrieves the state of all menus and their items at once, and
+        updates the cache.
+
+        :returns: List of :class:`MenuItemInfo`'s of the menus, including
+                  the nested ones, in document order.
+        """
+        self._update_menus(force=True)
+        return self._menus
+
+    def _update_menus(self, force=False):
+        with self.marionette.using_context('chrome'):
+            result = self.marionette.execute_script("""
+              let menubar = document.getElementById("main-menubar");
+              if (!("puppeteerGeneration" in menubar)) {
+                menubar.puppeteerGeneration = 0;
+                menubar.addEventListener("popupshowing", function () {
+                  menubar.puppeteerGeneration++;
+                });
+              }
+
+              let generation = menubar.puppeteerGeneration;
+              if (generation === arguments[0]) {
+                return {generation: generation, menus: null};
+              }
+
+              function serializeMenu(node) {
+                let info = {
+                  id: node.id || null,
+                  label: node.getAttribute("label"),
+                  accesskey: node.getAttribute("accesskey") || null,
+                  command: node.getAttribute("command") || null,
+                  disabled: node.getAttribute("disabled") == "true",
+                  element: node,
+                  items: [],
+                };
+
+                let popup = node.getElementsByTagName("menupopup")[0];
+                if (node.localName == "menu" && popup) {
+                  info.items = Array.map(popup.getElementsByTagName("menuitem"),
+                                         serializeMenu);
+                }
+
+                return info;
+              }
+
+              return {
+                generation: generation,
+                menus: Array.map(menubar.getElementsByTagName("menu"), serializeMenu),
+              };
+            """, script_args=[None if force else self._generation])
+
+        if result['menus'] is None:
+            return
+
+        self._menus = [MenuItemInfo(**menu) for menu in result['menus']]
+
+        self._menus_by_label = {}
+        self._items_by_id = {}
+        for menu in reversed(self._menus):
+            self._menus_by_label[menu.label] = menu
+            for item in menu.items:
+                if item.id:
+                    self._items_by_id[item.id] = item
+
+        self._generation = result['generation']
+
+    def _create_menu_element(self, info):
+        element = self.MenuElement(info.element)
+        element.menubar = self
+        return element
+
+    def _get_menu_info(self, label):
+        self._update_menus()
+        info = self._menus_by_label.get(label)
+        if info is None:
+            raise NoSuchElementException('Could not find a menu with '
+                                         'label "{}"'.format(label))
+
+        return info
+
+    def _get_item_info(self, menu, label):
+        item = menu.get_item(label)
+        if item is None:
+            message = ("Item labeled '{}' not found in the '{}' menu"
+                       .format(label, menu.label))
+            raise NoSuchElementException(message)
+
+        return item
+
+    def _select_item(self, info, trigger):
+        if trigger == 'click':
+            return info.element.click()
+        elif trigger == 'command':
+            # Runs the oncommand handler of the item, or of its <command>
+            with self.marionette.using_context('chrome'):
+                return self.marionette.execute_script("""
+                  arguments[0].doCommand();
+                """, script_args=[info.element])
+        else:
+            raise errors.InvalidValueError('Unknown selection method: "%s"' % trigger)
 
     class MenuElement(DOMElement):
         """
         Wraps a menu element.
         """
+        menubar = None
 
         @property
         def items(self):
             """
             :returns: A list of menuitem elements within this menu.
             """
-            return (self.find_element('tag name', 'menupopup')
-                        .find_elements('tag name', 'menuitem'))
+            return [item.element for item in self._get_info().items]
 
-        def select(self, label):
+        def select(self, label, trigger='click'):
             """
             Click on a menuitem within this menu.
 
             :param label: The label of the menuitem, e.g 'New Tab'
+            :param trigger: Optional, how to select the item. One of 'click', or
+             'command' to directly fire the command of the item. Defaults to 'click'.
             """
-            item = [l for l in self.items if l.get_attribute('label') == label]
-
-            if not item:
-                message = ("Item labeled '{}' not found in the '{}' menu"
-                           .format(label, self.get_attribute('label')))
-                raise NoSuchElementException(message)
+            menubar = self.menubar or MenuBar(self.get_marionette)
+            info = menubar._get_item_info(self._get_info(), label)
+            return menubar._select_item(info, trigger)
+
+        def _get_info(self):
+            menubar = self.menubar or MenuBar(self.get_marionette)
+            menubar._update_menus()
+            for info in menubar._menus:
+                if info.element == self:
+                    return info
+
+            raise NoSuchElementException('Menu is not part of the menubar')
+
+
+class MenuItemInfo(object):
+    """State of a menu or menuitem at the time it has been retrieved via
+    :func:`MenuBar.snapshot`.
+
+    :param id: The id of the element
+    :param label: The label of the element
+    :param accesskey: The access key of the element
+    :param command: The id of the `<command>` element it is bound to
+    :param disabled: Whether the element is disabled
+    :param element: The menu or menuitem element
+    :param items: For menus the list of :class:`MenuItemInfo`'s of their
+     menuitems, otherwise empty
+    """
 
-            return item[0].click()
+    def __init__(self, id, label, accesskey, command, disabled, element, items):
+        self.id = id
+        self.label = label
+        self.accesskey = accesskey
+        self.command = command
+        self.disabled = disabled
+        self.element = element
+        self.items = [MenuItemInfo(**item) for item in items]
+
+    def get_item(self, label):
+        """Returns the :class:`MenuItemInfo` of the menuitem with the given
+        label, or `None`."""
+        for item in self.items:
+            if item.label == label:
+                return item
+        return None
+
+    def __repr__(self):
+        return '<MenuItemInfo %s %s>' % (self.id, self.label)
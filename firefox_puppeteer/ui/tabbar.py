@@ -2,21 +2,30 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import itertools
+
 from marionette import (
     HTMLElement,
     Wait,
 )
 
-from marionette.errors import NoSuchElementException, StaleElementException
+from marionette.errors import NoSuchElementException
+
+import firefox_puppeteer.errors as errors
 
 from .. import DOMElement
 from ..base import BaseLib
+from ..decorators import use_class_as_property
+from .menu import MenuBar
 
 
 class Tabs(BaseLib):
 
     # TODO arrow scrollers, drop down list
 
+    # Ids of the listeners for tab events
+    _listener_ids = itertools.count()
+
     @property
     def newtab_button(self):
         """
@@ -32,28 +41,72 @@ class Tabs(BaseLib):
         :returns: The :class:`TabElement` corresponding to the currently active
                   tab.
         """
-        for tab in self.tabs:
-            if tab.is_active():
-                return tab
+        for info in self.snapshot():
+            if info.selected:
+                return info.tab
 
-    @property
+    @use_class_as_property('ui.tabbar.MenuPanel')
     def menupanel(self):
         """
         Provides access to the menu popup. This is the menu opened after
         clicking the settings button on the right hand side of the browser.
 
-        See the :class:`~ui.menu.MenuPanel` reference.
+        See the :class:`~ui.tabbar.MenuPanel` reference.
         """
-        return MenuPanel(lambda: self.marionette)
 
     @property
     def tabs(self):
         """
         :returns: A list of all the :class:`TabElement`'s.
         """
-        tabs = (self.marionette.find_element('id', 'tabbrowser-tabs')
-                               .find_elements('tag name', 'tab'))
-        return [self.TabElement(tab) for tab in tabs]
+        return [info.tab for info in self.snapshot()]
+
+    def close_tabs(self, target):
+        """Closes multiple tabs at once, and waits until all of them have been
+        removed from the tab strip.
+
+        :param target: Either a list of indexes of `tabs`, or a callback which
+         gets called with the :class:`TabInfo` of each tab, and returns `True`
+         for the tabs to close.
+        """
+        infos = self.snapshot()
+
+        if callable(target):
+            tabs = [info.tab.inner for info in infos if target(info)]
+        elif isinstance(target, list):
+            tabs = [infos[index].tab.inner for index in target]
+        else:
+            raise TypeError("Invalid type for 'target': {}".format(type(target)))
+
+        if not tabs:
+            return
+
+        timeout = Wait(self.marionette).timeout
+
+        with self.marionette.using_context('chrome'):
+            self.marionette.execute_async_script("""
+              let tabsToClose = arguments[0];
+              let container = gBrowser.tabContainer;
+
+              function allRemoved() {
+                return tabsToClose.every(tab => !tab.parentNode);
+              }
+
+              // Closed tabs can get removed after their closing animation
+              let observer = new MutationObserver(function () {
+                if (allRemoved()) {
+                  observer.disconnect();
+                  marionetteScriptFinished(true);
+                }
+              });
+              observer.observe(container, {childList: true});
+
+              tabsToClose.forEach(tab => gBrowser.removeTab(tab));
+              if (allRemoved()) {
+                observer.disconnect();
+                marionetteScriptFinished(true);
+              }
+            """, script_args=[tabs], script_timeout=int(timeout * 1000))
 
     def get_tab(self, target):
         """
@@ -63,18 +116,117 @@ class Tabs(BaseLib):
         :returns: A :class:`TabElement` corresponding to the specified tab.
         """
         if isinstance(target, int):
-            return self.tabs[target]
+            return self.snapshot()[target].tab
 
         if isinstance(target, basestring):
-            for tab in self.tabs:
-                if target in tab.get_attribute('label'):
-                    return tab
+            for info in self.snapshot():
+                if target in info.label:
+                    return info.tab
 
             raise NoSuchElementException('Tab with a label containing "{}"" not'
                                          ' found'.format(target))
 
         raise TypeError("Invalid type for 'target': {}".format(type(target)))
 
+    def open_tabs(self, urls):
+        """Opens a background tab for each of the given URLs at once, and
+        waits until all of them have finished loading.
+
+        :param urls: List of URLs to load
+
+        :returns: List of :class:`TabElement`'s of the new tabs
+        """
+        timeout = Wait(self.marionette).timeout
+
+        with self.marionette.using_context('chrome'):
+            tabs = self.marionette.execute_async_script("""
+              let urls = arguments[0];
+
+              let tabs = urls.map(url => gBrowser.addTab(url));
+              let loading = new Set(tabs.filter((tab, index) => urls[index] != "about:blank")
+                                        .map(tab => tab.linkedBrowser));
+
+              let listener = {
+                onStateChange: function (browser, webProgress, request, flags, status) {
+                  if (webProgress.isTopLevel &&
+                      (flags & Ci.nsIWebProgressListener.STATE_STOP) &&
+                      (flags & Ci.nsIWebProgressListener.STATE_IS_WINDOW)) {
+                    loading.delete(browser);
+                    if (!loading.size) {
+                      finish();
+                    }
+                  }
+                }
+              };
+
+              function finish() {
+                gBrowser.removeTabsProgressListener(listener);
+                marionetteScriptFinished(tabs);
+              }
+
+              if (loading.size) {
+                gBrowser.addTabsProgressListener(listener);
+              } else {
+                finish();
+              }
+            """, script_args=[urls], script_timeout=int(timeout * 1000))
+
+        return [self.TabElement(tab) for tab in tabs]
+
+    def open_tab(self, trigger='button'):
+        """Opens a new tab by using the specified trigger.
+
+        :param trigger: Optional, method in how to open the new tab. This can
+         be a string with one of `button` or `menu`, or a callback which gets
+         triggered with the current :class:`Tabs` instance as parameter.
+         Defaults to `button`.
+
+        :returns: :class:`TabElement` of the new tab
+        """
+        if not callable(trigger) and trigger not in ('button', 'menu'):
+            raise errors.InvalidValueError('Unknown opening method: "%s"' % trigger)
+
+        def callback():
+            # Prepare action which triggers the opening of the tab
+            if callable(trigger):
+                trigger(self)
+            elif trigger == 'button':
+                self.newtab_button.click()
+            elif trigger == 'menu':
+                MenuBar(self.get_marionette).select_by_id('menu_newNavigatorTab')
+
+        # Listen for the new tab first, so it can't be missed
+        listener_id = self._add_tab_listener('TabOpen')
+
+        return self.TabElement(self._wait_for_tab_listener(listener_id, callback))
+
+    def snapshot(self):
+        """Retrieves the state of all tabs at once.
+
+        :returns: List of :class:`TabInfo`'s in the order of the tabs.
+        """
+        with self.marionette.using_context('chrome'):
+            infos = self.marionette.execute_script("""
+              let infos = [];
+
+              for (let index = 0; index < gBrowser.tabs.length; index++) {
+                let tab = gBrowser.tabs[index];
+                infos.push({
+                  index: index,
+                  label: tab.label,
+                  selected: tab.selected,
+                  pinned: tab.pinned,
+                  busy: tab.hasAttribute("busy"),
+                  url: tab.linkedBrowser.currentURI.spec,
+                  element: tab,
+                });
+              }
+
+              return infos;
+            """)
+
+        return [TabInfo(**info) for info in infos]
+
     def switch_to_tab(self, tab):
         """
         Switch to (activate) the specified tab.
@@ -86,6 +238,226 @@ class Tabs(BaseLib):
             tab = self.get_tab(tab)
         return tab.click()
 
+    def wait_for_page_load(self, trigger, url=None):
+        """Triggers a page load in the selected tab, and waits until it has
+        finished loading. Pages restored from the back-forward cache are
+        taken into account.
+
+        :param trigger: Function to trigger the page load. It is triggered
+         with the current :class:`Tabs` instance as parameter.
+        :param url: Optional, only finish once this URL has been loaded,
+         e.g. to skip redirects. Defaults to the first page which has loaded.
+
+        :returns: The URL of the loaded page
+        """
+        # Listen for the page load first, so it can't be missed
+        listener_id = self._add_page_load_listener(url)
+
+        return self._wait_for_tab_listener(listener_id, lambda: trigger(self))
+
+    def _add_page_load_listener(self, url=None):
+        """Registers a listener for the next page load in the selected tab.
+
+        :param url: Optional, the URL of the page to wait for
+
+        :returns: The id of the listener
+        """
+        listener_id = next(self._listener_ids)
+
+        with self.marionette.using_context('chrome'):
+            self.marionette.execute_script("""
+              let [id, url] = arguments;
+
+              if (!window.puppeteerTabListeners) {
+                window.puppeteerTabListeners = {};
+              }
+              let listener = window.puppeteerTabListeners[id] = {done: false, result: null,
+                                                                 resolve: null};
+
+              let browser = gBrowser.selectedBrowser;
+
+              function unregister() {
+                gBrowser.removeTabsProgressListener(progressListener);
+                browser.removeEventListener("pageshow", onPageShow, true);
+              }
+
+              listener.remove = function () {
+                unregister();
+                delete window.puppeteerTabListeners[id];
+              };
+
+              function done() {
+                unregister();
+
+                listener.done = true;
+                listener.result = browser.currentURI.spec;
+                if (listener.resolve) {
+                  listener.resolve(listener.result);
+                }
+              }
+
+              function matches() {
+                return !url || browser.currentURI.spec == url;
+              }
+
+              // Only follow the browser of the tab which has been selected
+              // when registering, even if another tab gets selected
+              let progressListener = {
+                onStateChange: function (aBrowser, webProgress, request, flags, status) {
+                  if (aBrowser == browser && webProgress.isTopLevel &&
+                      (flags & Ci.nsIWebProgressListener.STATE_STOP) &&
+                      (flags & Ci.nsIWebProgressListener.STATE_IS_WINDOW) &&
+                      matches()) {
+                    done();
+                  }
+                }
+              };
+
+              // Pages restored from the back-forward cache are not loaded again
+              function onPageShow(event) {
+                if (event.persisted && event.target == browser.contentDocument && matches()) {
+                  done();
+                }
+              }
+
+              gBrowser.addTabsProgressListener(progressListener);
+              browser.addEventListener("pageshow", onPageShow, true);
+            """, script_args=[listener_id, url])
+
+        return listener_id
+
+    def _add_tab_listener(self, event, tab=None):
+        """Registers a listener for the next tab event of the given type.
+
+        :param event: The type of the event, one of `TabOpen`, `TabSelect` or
+         `TabClose`. A closed tab is only reported once it has been removed
+         from the tab strip.
+        :param tab: Optional, the tab element to listen for events of.
+         A selected tab is reported for `TabSelect` right away.
+
+        :returns: The id of the listener, or `None` for `TabClose` if closing
+         the last tab closes the window as well, so that it can't be waited for
+        """
+        listener_id = next(self._listener_ids)
+
+        with self.marionette.using_context('chrome'):
+            registered = self.marionette.execute_script("""
+              Cu.import("resource://gre/modules/Services.jsm");
+
+              let [id, type, tab] = arguments;
+
+              if (type == "TabClose" && gBrowser.tabs.length == 1 &&
+                  Services.prefs.getBoolPref("browser.tabs.closeWindowWithLastTab")) {
+                return false;
+              }
+
+              if (!window.puppeteerTabListeners) {
+                window.puppeteerTabListeners = {};
+              }
+              let listener = window.puppeteerTabListeners[id] = {done: false, result: null,
+                                                                 resolve: null};
+
+              let container = gBrowser.tabContainer;
+              let observer = null;
+
+              listener.remove = function () {
+                container.removeEventListener(type, onEvent);
+                if (observer) {
+                  observer.disconnect();
+                }
+                delete window.puppeteerTabListeners[id];
+              };
+
+              function done(result) {
+                listener.done = true;
+                listener.result = result;
+                if (listener.resolve) {
+                  listener.resolve(result);
+                }
+              }
+
+              function onEvent(event) {
+                let target = event.target;
+                if (tab && target != tab) {
+                  return;
+                }
+                container.removeEventListener(type, onEvent);
+
+                if (type != "TabClose" || !target.parentNode) {
+                  done(type == "TabClose" ? null : target);
+                  return;
+                }
+
+                // Closed tabs get removed after their closing animation
+                observer = new MutationObserver(function () {
+                  if (!target.parentNode) {
+                    observer.disconnect();
+                    done(null);
+                  }
+                });
+                observer.observe(container, {childList: true});
+              }
+
+              if (type == "TabSelect" && tab && tab.selected) {
+                done(tab);
+              } else {
+                container.addEventListener(type, onEvent);
+              }
+
+              return true;
+            """, script_args=[listener_id, event, tab])
+
+        return listener_id if registered else None
+
+    def _remove_tab_listener(self, listener_id):
+        """Unregisters a listener which has not been waited for."""
+        with self.marionette.using_context('chrome'):
+            self.marionette.execute_script("""
+              let listener = (window.puppeteerTabListeners || {})[arguments[0]];
+              if (listener) {
+                listener.remove();
+              }
+            """, script_args=[listener_id])
+
+    def _wait_for_tab_listener(self, listener_id, trigger=None):
+        """Triggers the event the given listener has been registered for, and
+        waits until it has happened. If that fails, the listener gets removed.
+
+        :param trigger: Optional, function without arguments which triggers
+         the event
+
+        :returns: The tab element of the event, `None` for closed tabs, or
+         the URL for page loads
+        """
+        timeout = Wait(self.marionette).timeout
+
+        waited = False
+        try:
+            if trigger is not None:
+                trigger()
+
+            with self.marionette.using_context('chrome'):
+                result = self.marionette.execute_async_script("""
+                  let id = arguments[0];
+                  let tabListeners = window.puppeteerTabListeners;
+
+                  tabListeners[id].resolve = function (result) {
+                    tabListeners[id].remove();
+                    marionetteScriptFinished(result);
+                  };
+
+                  if (tabListeners[id].done) {
+                    tabListeners[id].resolve(tabListeners[id].result);
+                  }
+                """, script_args=[listener_id], script_timeout=int(timeout * 1000))
+            waited = True
+        finally:
+            # Don't leave the listener behind, e.g. for the next opened tab
+            if not waited:
+                self._remove_tab_listener(listener_id)
+
+        return result
+
     class TabElement(DOMElement):
         """
         Wraps a tab element.
@@ -106,63 +478,175 @@ class Tabs(BaseLib):
         def close(self):
             """
             Closes this tab.
+
+            If it is the last tab, and the `browser.tabs.closeWindowWithLastTab`
+            preference is set, the window gets closed as well. Marionette has
+            to be switched to another window afterwards.
             """
             close_button = (self.find_element('anon', None)
                                 .find_element('class name',
                                               'tab-close-button'))
-            ret = close_button.click()
 
-            def im_gone(m):
-                try:
-                    self.tag_name
-                    return False
-                except StaleElementException:
-                    return True
-            Wait(self.marionette).until(im_gone)
-            return ret
+            tabbar = Tabs(self.get_marionette)
+            listener_id = tabbar._add_tab_listener('TabClose', self.inner)
+            if listener_id is None:
+                # The window gets closed with its last tab
+                return close_button.click()
+
+            ret = []
+            tabbar._wait_for_tab_listener(listener_id,
+                                          lambda: ret.append(close_button.click()))
+
+            return ret[0]
+
+
+class TabInfo(object):
+    """State of a tab at the time it has been retrieved via
+    :func:`Tabs.snapshot`.
+
+    :param index: The position of the tab in the tab bar
+    :param label: The label of the tab
+    :param selected: Whether it is the selected tab
+    :param pinned: Whether the tab has been pinned
+    :param busy: Whether the tab is still loading
+    :param url: URL of the page loaded in the tab
+    :param element: The tab element, which is available as :class:`Tabs.TabElement`
+     via `tab`
+    """
+
+    def __init__(self, index, label, selected, pinned, busy, url, element):
+        self.index = index
+        self.label = label
+        self.selected = selected
+        self.pinned = pinned
+        self.busy = busy
+        self.url = url
+        self.tab = Tabs.TabElement(element)
+
+    def __repr__(self):
+        return '<TabInfo %d %s>' % (self.index, self.url)
 
 
 class MenuPanel(BaseLib):
 
+    def __init__(self, marionette_getter):
+        BaseLib.__init__(self, marionette_getter)
+
+        # Number of times the popup had been shown when the buttons have been
+        # retrieved, and the buttons in order and by their label and id
+        self._generation = None
+        self._buttons = []
+        self._button_index = {}
+
+    @property
+    def button_index(self):
+        """Retrieves the state of all buttons in the menu panel at once. The
+        buttons are only retrieved again once the popup has been shown again.
+
+        :returns: Dictionary which maps the label and the id of each button
+         to its :class:`PanelButtonInfo`
+        """
+        self._update_buttons()
+        return self._button_index
+
+    def _update_buttons(self):
+        with self.marionette.using_context('chrome'):
+            result = self.marionette.execute_script("""
+              let popup = document.getElementById("PanelUI-popup");
+              if (!("puppeteerGeneration" in popup)) {
+                popup.puppeteerGeneration = 0;
+                popup.addEventListener("popupshowing", function () {
+                  popup.puppeteerGeneration++;
+                });
+              }
+
+              let generation = popup.puppeteerGeneration;
+              if (generation === arguments[0]) {
+                return {generation: generation, buttons: null};
+              }
+
+              let multiView = document.getElementById("PanelUI-multiView");
+              let container = document.getAnonymousElementByAttribute(multiView, "anonid",
+                                                                      "viewContainer");
+              let buttons = Array.map(container.getElementsByTagName("toolbarbutton"),
+                                      button => ({
+                                        id: button.id,
+                                        label: button.getAttribute("label"),
+                                        disabled: button.disabled,
+                                        element: button,
+                                      }));
+
+              return {generation: generation, buttons: buttons};
+            """, script_args=[self._generation])
+
+        if result['buttons'] is not None:
+            self._buttons = [PanelButtonInfo(**button) for button in result['buttons']]
+
+            # Labels take precedence over ids
+            self._button_index = dict((info.id, info) for info in self._buttons if info.id)
+            self._button_index.update((info.label, info) for info in self._buttons
+                                      if info.label)
+
+            self._generation = result['generation']
+
     @property
     def popup(self):
         """
         :returns: The :class:`MenuPanelElement`.
         """
         popup = self.marionette.find_element('id', 'PanelUI-popup')
-        return self.MenuPanelElement(popup)
+        element = self.MenuPanelElement(popup)
+        element.menupanel = self
+        return element
 
     class MenuPanelElement(DOMElement):
         """
         Wraps the menu panel.
         """
-        _buttons = None
+        menupanel = None
 
         @property
         def buttons(self):
             """
             :returns: A list of all the clickable buttons in the menu panel.
             """
-            if not self._buttons:
-                self._buttons = (self.find_element('id', 'PanelUI-multiView')
-                                     .find_element('anon attribute',
-                                                   {'anonid': 'viewContainer'})
-                                     .find_elements('tag name',
-                                                    'toolbarbutton'))
-            return self._buttons
+            menupanel = self.menupanel or MenuPanel(self.get_marionette)
+            menupanel._update_buttons()
+            return [info.button for info in menupanel._buttons]
 
         def click(self, target=None):
             """
             Overrides HTMLElement.click to provide a target to click.
 
-            :param target: The label associated with the button to click on,
-             e.g 'New Private Window'.
+            :param target: The label or the id associated with the button to
+             click on, e.g 'New Private Window'.
             """
             if not target:
                 return DOMElement.click(self)
 
-            for button in self.buttons:
-                if button.get_attribute('label') == target:
-                    return button.click()
-            raise NoSuchElementException('Could not find "{}"" in the '
-                                         'menu panel UI'.format(target))
+            menupanel = self.menupanel or MenuPanel(self.get_marionette)
+            info = menupanel.button_index.get(target)
+            if info is None:
+                raise NoSuchElementException('Could not find "{}"" in the '
+                                             'menu panel UI'.format(target))
+            return info.button.click()
+
+
+class PanelButtonInfo(object):
+    """State of a button in the menu panel at the time it has been retrieved
+    via :func:`MenuPanel.button_index`.
+
+    :param id: The id of the button
+    :param label: The label of the button
+    :param disabled: Whether the button is disabled
+    :param element: The button element, which is available via `button`
+    """
+
+    def __init__(self, id, label, disabled, element):
+        self.id = id
+        self.label = label
+        self.disabled = disabled
+        self.button = element
+
+    def __repr__(self):
+        return '<PanelButtonInfo %s %s>' % (self.id, self.label)
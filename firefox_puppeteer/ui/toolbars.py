@@ -8,6 +8,8 @@ from ..api.keys import Keys
 from ..api.l10n import L10n
 from ..base import BaseLib
 from ..decorators import use_class_as_property
+from .tabbar import Tabs
+from .windows import Windows
 
 
 class NavBar(BaseLib):
@@ -114,10 +116,12 @@ class LocationBar(BaseLib):
         """Focus the location bar according to the provided event.
 
         :param evt: The event to synthesize in order to focus the urlbar
-                    (one of 'click' or 'shortcut').
+                    (one of 'click', 'shortcut' or 'command').
         """
         if evt == 'click':
             self.urlbar.click()
+        elif evt == 'command':
+            self._do_command('Browser:OpenLocation')
         elif evt == 'shortcut':
             cmd_key = self.l10n.get_localized_entity(LocationBar.dtds,
                                                      'openCmd.commandkey')
@@ -158,15 +162,27 @@ class LocationBar(BaseLib):
         See the :class:`~ui.toolbars.IdentityPopup` reference.
         """
 
-    def load_url(self, url):
+    def load_url(self, url, wait=True):
         """Load the specified url in the location bar by synthesized
         keystrokes.
 
         :param url: The url to load.
+        :param wait: Optional, whether to wait until the page has been loaded.
+         Navigations within the same document, like changes of the hash or
+         `javascript:` URLs, don't load a page, and need `False`.
+         Defaults to `True`.
+
+        :returns: The URL of the loaded page, or `None` if not waited for
         """
-        self.clear()
-        self.focus('shortcut')
-        self.urlbar.send_keys(url + Keys.ENTER)
+        def trigger(tabbar):
+            self.clear()
+            self.focus('shortcut')
+            self.urlbar.send_keys(url + Keys.ENTER)
+
+        if wait:
+            return Tabs(lambda: self.marionette).wait_for_page_load(trigger)
+
+        trigger(None)
 
     @property
     def notification_popup(self):
@@ -188,13 +204,15 @@ class LocationBar(BaseLib):
         """Reload the currently open page.
 
         :param trigger: The event type to use to cause the reload. (one of
-                        "shortcut", "shortcut2", or "button").
+                        "shortcut", "shortcut2", "button", or "command").
         :param force: Whether to cause a forced reload.
         """
-        # TODO: The force parameter is ignored for the moment. Use
-        # mouse event modifiers or actions when they're ready.
-        # Bug 1097705 tracks this feature in marionette.
-        if trigger == 'button':
+        # TODO: The force parameter is ignored for the moment, except for the
+        # "command" trigger. Use mouse event modifiers or actions when they're
+        # ready. Bug 1097705 tracks this feature in marionette.
+        if trigger == 'command':
+            self._do_command('Browser:ReloadSkipCache' if force else 'Browser:Reload')
+        elif trigger == 'button':
             self.reload_button.click()
         elif trigger == 'shortcut':
             cmd_key = self.l10n.get_localized_entity(LocationBar.dtds,
@@ -235,6 +253,13 @@ class LocationBar(BaseLib):
         """
         return self.urlbar.get_attribute('value')
 
+    def _do_command(self, command_id):
+        """Fires the XUL command with the given id in the current window.
+
+        See :func:`~ui.windows.BaseWindow.do_command`.
+        """
+        Windows(self.get_marionette).current.do_command(command_id)
+
 
 class AutocompleteResults(BaseLib):
     """Library for interacting with autocomplete results.
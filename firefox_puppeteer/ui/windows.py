@@ -2,10 +2,11 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this file,
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from time import sleep
+import itertools
+import weakref
 
 from marionette import By, Wait
-from marionette.errors import NoSuchWindowException
+from marionette.errors import NoSuchElementException, NoSuchWindowException
 from marionette.keys import Keys
 
 import firefox_puppeteer.errors as errors
@@ -17,6 +18,9 @@ from ..decorators import use_class_as_property
 
 class Windows(BaseLib):
 
+    # Maps each Marionette instance to the :class:`WindowState` of its session
+    _states = weakref.WeakKeyDictionary()
+
     @property
     def all(self):
         """Retrieves a list of all open chrome windows.
@@ -24,8 +28,7 @@ class Windows(BaseLib):
         :returns: List of :class:`BaseWindow`'s corresponding to the
                   windows in `marionette.chrome_window_handles`.
         """
-        return [self.create_window_instance(handle) for handle in
-                self.marionette.chrome_window_handles]
+        return [self._create_window_instance(info) for info in self.snapshot()]
 
     @property
     def current(self):
@@ -33,7 +36,15 @@ class Windows(BaseLib):
 
         :returns: The :class:`BaseWindow` for the currently active window.
         """
-        return self.create_window_instance(self.marionette.current_chrome_window_handle)
+        handle = self._get_selected()
+
+        # The selected window could have been closed by the UI or by a script
+        handles = self.marionette.chrome_window_handles
+        if handle not in handles:
+            self._get_state().update_handles(handles)
+            raise NoSuchWindowException("No window found for '{}'".format(handle))
+
+        return self.create_window_instance(handle)
 
     @property
     def focused_chrome_window_handle(self):
@@ -56,6 +67,7 @@ class Windows(BaseLib):
         :param handle: The handle of the chrome window
         """
         self.switch_to(handle)
+        self._get_state().forget(handle)
 
         # TODO: Maybe needs to wait as handled via an observer
         return self.marionette.close_chrome_window()
@@ -68,6 +80,9 @@ class Windows(BaseLib):
 
         :param exceptions: Optional, list or a single entry of handles or
          :class:`BaseWindow` instances not to close
+
+        :returns: List of handles of the windows which refused to close, e.g.
+         because of a `beforeunload` prompt
         """
         handles_to_keep = exceptions or []
         if not isinstance(handles_to_keep, list):
@@ -77,10 +92,81 @@ class Windows(BaseLib):
         handles_to_keep = [entry.handle if isinstance(entry, BaseWindow) else entry
                            for entry in handles_to_keep]
 
-        # Find handles to close and close them all
-        handles_to_close = set(self.marionette.chrome_window_handles) - set(handles_to_keep)
-        for handle in handles_to_close:
-            self.close(handle)
+        handles = self.marionette.chrome_window_handles
+        handles_to_keep = [handle for handle in handles_to_keep if handle in handles]
+        if len(handles_to_keep) == len(handles):
+            return []
+
+        # Without a remaining window to run the script in, close them one by one
+        if not handles_to_keep:
+            for handle in handles:
+                self.close(handle)
+            return []
+
+        if self._get_selected() not in handles_to_keep:
+            self._select(handles_to_keep[0])
+
+        timeout = int(Wait(self.marionette).timeout * 1000)
+
+        with self.marionette.using_context('chrome'):
+            refused = self.marionette.execute_async_script("""
+              Cu.import("resource://gre/modules/Services.jsm");
+
+              let [handlesToKeep, timeout] = arguments;
+
+              function getHandle(win) {
+                return win.QueryInterface(Ci.nsIInterfaceRequestor)
+                          .getInterface(Ci.nsIDOMWindowUtils)
+                          .outerWindowID.toString();
+              }
+
+              let windowsToClose = [];
+              let windows = Services.wm.getEnumerator(null);
+              while (windows.hasMoreElements()) {
+                let win = windows.getNext();
+                if (handlesToKeep.indexOf(getHandle(win)) == -1) {
+                  windowsToClose.push(win);
+                }
+              }
+
+              let timer = null;
+              let finished = false;
+
+              function finish() {
+                if (finished) {
+                  return;
+                }
+                finished = true;
+
+                Services.ww.unregisterNotification(observer);
+                window.clearTimeout(timer);
+
+                // Report the windows which are still open, e.g. due to a
+                // beforeunload prompt
+                marionetteScriptFinished(windowsToClose.filter(win => !win.closed)
+                                                       .map(getHandle));
+              }
+
+              function observer(subject, topic) {
+                if (topic == "domwindowclosed" && windowsToClose.every(win => win.closed)) {
+                  finish();
+                }
+              }
+
+              Services.ww.registerNotification(observer);
+              timer = window.setTimeout(finish, timeout);
+
+              windowsToClose.forEach(win => win.close());
+              if (windowsToClose.every(win => win.closed)) {
+                finish();
+              }
+            """, script_args=[handles_to_keep, timeout], script_timeout=timeout * 2)
+
+        state = self._get_state()
+        for handle in set(handles) - set(handles_to_keep + refused):
+            state.forget(handle)
+
+        return refused
 
     def create_window_instance(self, handle, expected_class=None):
         """Creates a :class:`BaseWindow` instance for the given chrome window
@@ -88,24 +174,32 @@ class Windows(BaseLib):
         :param handle: The handle of the chrome window
         :param expected_class: Optional, check for the correct window class
         """
-        current_handle = self.marionette.current_chrome_window_handle
-        window = None
-
-        try:
-            # Retrieve window type to determine the type of chrome window
-            if handle != self.marionette.current_chrome_window_handle:
-                self.switch_to(handle)
-            window_type = self.marionette.get_window_type()
-        finally:
-            # Ensure to switch back to the original window
-            if handle != current_handle:
-                self.marionette.switch_to_window(current_handle)
-
-        if window_type == 'navigator:browser':
-            window = BrowserWindow(lambda: self.marionette, handle)
+        window = self._get_state().instances.get(handle)
+        if window is None:
+            for info in self.snapshot():
+                if info.handle == handle:
+                    return self._create_window_instance(info, expected_class)
+
+            raise NoSuchWindowException("No window found for '{}'".format(handle))
+
+        if expected_class is not None and type(window) is not expected_class:
+            raise errors.UnexpectedWindowTypeError('Expected window "%s" but got "%s"' %
+                                                   (expected_class, type(window)))
+
+        return window
+
+    def _create_window_instance(self, info, expected_class=None):
+        instances = self._get_state().instances
+        window = instances.get(info.handle)
+
+        if window is not None:
+            pass
+        elif info.window_type == 'navigator:browser':
+            window = instances[info.handle] = BrowserWindow(lambda: self.marionette,
+                                                            info.handle, info)
         else:
             raise errors.UnknownWindowError('Unknown window type "%s" for handle: "%s"' %
-                                            (window_type, handle))
+                                            (info.window_type, info.handle))
 
         if expected_class is not None and type(window) is not expected_class:
             raise errors.UnexpectedWindowTypeError('Expected window "%s" but got "%s"' %
@@ -120,50 +214,227 @@ class Windows(BaseLib):
         """
         self.switch_to(handle)
 
+        timeout = Wait(self.marionette).timeout
+
+        # Wait for the window to be activated instead of polling for it
         with self.marionette.using_context('chrome'):
-            self.marionette.execute_script(""" window.focus(); """)
+            self.marionette.execute_async_script("""
+              Cu.import("resource://gre/modules/Services.jsm");
 
-        wait = Wait(self.marionette)
-        wait.until(lambda m: handle == self.focused_chrome_window_handle)
+              if (Services.wm.getMostRecentWindow("") == window) {
+                marionetteScriptFinished(true);
+              } else {
+                window.addEventListener("activate", function onActivate() {
+                  window.removeEventListener("activate", onActivate);
+                  marionetteScriptFinished(true);
+                });
+                window.focus();
+              }
+            """, script_timeout=int(timeout * 1000))
+
+    def snapshot(self):
+        """Retrieves the state of all open chrome windows at once, without
+        switching to any of them.
+
+        :returns: List of :class:`WindowInfo`'s in the order of
+                  `marionette.chrome_window_handles`.
+        """
+        with self.marionette.using_context('chrome'):
+            infos = self.marionette.execute_script("""
+              Cu.import("resource://gre/modules/Services.jsm");
+              Cu.import("resource://gre/modules/PrivateBrowsingUtils.jsm");
+
+              let focused = Services.wm.getMostRecentWindow("");
+              let infos = [];
+
+              let windows = Services.wm.getEnumerator(null);
+              while (windows.hasMoreElements()) {
+                let win = windows.getNext();
+                infos.push({
+                  handle: win.QueryInterface(Ci.nsIInterfaceRequestor)
+                             .getInterface(Ci.nsIDOMWindowUtils)
+                             .outerWindowID.toString(),
+                  window_type: win.document.documentElement.getAttribute("windowtype"),
+                  is_private: PrivateBrowsingUtils.isWindowPrivate(win),
+                  focused: win == focused,
+                  url: win.gBrowser ? win.gBrowser.currentURI.spec : win.location.href,
+                  title: win.document.title,
+                  tab_count: win.gBrowser ? win.gBrowser.tabs.length : 0,
+                });
+              }
+
+              return infos;
+            """)
 
-    def switch_to(self, target):
+        infos = [WindowInfo(**info) for info in infos]
+        self._get_state().update_handles([info.handle for info in infos])
+
+        return infos
+
+    def _get_state(self):
+        """Returns the :class:`WindowState` of the current session."""
+        state = self._states.get(self.marionette)
+        if state is None or state.session_id != self.marionette.session_id:
+            state = self._states[self.marionette] = WindowState(self.marionette.session_id)
+        elif state.marionette_window != self.marionette.window:
+            # Marionette has been switched to another window directly
+            state.invalidate()
+            state.marionette_window = self.marionette.window
+        return state
+
+    def _get_selected(self):
+        """Returns the handle of the selected chrome window."""
+        state = self._get_state()
+        if state.selected is None:
+            state.select(self.marionette.current_chrome_window_handle, self.marionette.window)
+        return state.selected
+
+    def _select(self, handle):
+        """Switches Marionette to the given chrome window, unless it is known
+        to be selected already."""
+        state = self._get_state()
+        if handle != state.selected:
+            self.marionette.switch_to_window(handle)
+            state.select(handle, self.marionette.window)
+
+    def switch_to(self, target, snapshot=False):
         """Switches context to the specified chrome window.
 
         :param target: The window to switch to. `target` can be a `handle` or a
                        callback that returns True in the context of the desired
                        window.
+        :param snapshot: Optional, if `True` a callback gets called with the
+                         :class:`WindowInfo` of each window instead, so that only
+                         the matching window has to be switched to.
+                         Defaults to `False`.
 
         :returns: The old `window_handle`. This makes it easy to switch back
                   to the original window later.
         """
-        target_handle = None
-
-        if target in self.marionette.chrome_window_handles:
-            target_handle = target
-        elif callable(target):
-            current_handle = self.marionette.current_chrome_window_handle
+        state = self._get_state()
+        window = state.instances.get(target) if not callable(target) else None
+
+        # Known windows can be switched to without retrieving their state.
+        # Windows can also be closed directly via Marionette, by the UI, or by
+        # scripts, which Marionette reports when switching to another window.
+        if window is not None:
+            try:
+                if target != state.selected:
+                    self._select(target)
+                elif target not in self.marionette.chrome_window_handles:
+                    raise NoSuchWindowException("No window found for '{}'".format(target))
+                return window
+            except NoSuchWindowException:
+                state.forget(target)
+                raise
+
+        infos = self.snapshot()
+        target_info = None
+
+        for info in infos:
+            if info.handle == target:
+                target_info = info
+
+        if target_info is None and callable(target) and snapshot:
+            # evaluates the callback without switching to any window
+            target_info = next((info for info in infos if target(info)), None)
+
+        elif target_info is None and callable(target):
+            current_handle = self._get_selected()
 
             # switches context if callback for a chrome window returns `True`.
-            for handle in self.marionette.chrome_window_handles:
-                self.marionette.switch_to_window(handle)
-                window = self.create_window_instance(handle)
+            for info in infos:
+                self._select(info.handle)
+                window = self._create_window_instance(info)
                 if target(window):
-                    target_handle = handle
+                    target_info = info
                     break
 
             # if no handle has been found switch back to original window
-            if not target_handle:
-                self.marionette.switch_to_window(current_handle)
+            if not target_info:
+                self._select(current_handle)
 
-        if target_handle is None:
+        if target_info is None:
             raise NoSuchWindowException("No window found for '{}'"
                                         .format(target))
 
-        # only switch if necessary
-        if target_handle != self.marionette.current_chrome_window_handle:
-            self.marionette.switch_to_window(target_handle)
+        self._select(target_info.handle)
+
+        return self._create_window_instance(target_info)
+
+
+class WindowState(object):
+    """Client-side state of the chrome windows of a Marionette session, which
+    saves the round trips for retrieving it again and again.
+
+    The selected window is only valid as long as all windows get switched to
+    via the puppeteer libraries. Switching Marionette to another window
+    directly invalidates it.
+
+    :param session_id: The id of the Marionette session
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+
+        # Window instances by handle, so that a handle always yields the same object
+        self.instances = {}
+
+        # Handle of the selected chrome window
+        self.selected = None
+
+        # Value of `marionette.window` when the selected window has been
+        # recorded, which changes with each direct switch
+        self.marionette_window = None
+
+    def forget(self, handle):
+        """Removes all state of a closed chrome window."""
+        self.instances.pop(handle, None)
+        if handle == self.selected:
+            self.selected = None
 
-        return self.create_window_instance(target_handle)
+    def update_handles(self, handles):
+        """Forgets about all chrome windows which are not part of the given
+        handles of the open windows anymore."""
+        for handle in set(self.instances) | set([self.selected]):
+            if handle not in handles:
+                self.forget(handle)
+
+    def invalidate(self):
+        """Forgets the selected window."""
+        self.selected = None
+
+    def select(self, handle, marionette_window):
+        """Records the selected chrome window."""
+        self.selected = handle
+        self.marionette_window = marionette_window
+
+
+class WindowInfo(object):
+    """State of a chrome window at the time it has been retrieved via
+    :func:`Windows.snapshot`.
+
+    :param handle: The `window handle` of the chrome window
+    :param window_type: The value of the `windowtype` attribute
+    :param is_private: Whether it is a Private Browsing window
+    :param focused: Whether it is the focused chrome window
+    :param url: URL of the selected tab for browser windows, otherwise the
+     URL of the chrome window itself
+    :param title: Title of the chrome window
+    :param tab_count: Number of tabs for browser windows, otherwise `0`
+    """
+
+    def __init__(self, handle, window_type, is_private, focused, url, title, tab_count):
+        self.handle = handle
+        self.window_type = window_type
+        self.is_private = is_private
+        self.focused = focused
+        self.url = url
+        self.title = title
+        self.tab_count = tab_count
+
+    def __repr__(self):
+        return '<WindowInfo %s %s>' % (self.handle, self.window_type)
 
 
 class BaseWindow(BaseLib):
@@ -173,12 +444,16 @@ class BaseWindow(BaseLib):
     dtds = []
     properties = []
 
-    def __init__(self, marionette_getter, window_handle):
+    # Ids of the listeners for opened windows
+    _listener_ids = itertools.count()
+
+    def __init__(self, marionette_getter, window_handle, window_info=None):
         BaseLib.__init__(self, marionette_getter)
         self._l10n = L10n(self.get_marionette)
         self._windows = Windows(self.get_marionette)
 
-        if window_handle not in self.marionette.chrome_window_handles:
+        # A window which is part of a snapshot is known to exist
+        if window_info is None and window_handle not in self.marionette.chrome_window_handles:
             raise errors.UnknownWindowError('Window with handle "%s" does not exist' %
                                             window_handle)
         self._handle = window_handle
@@ -197,7 +472,7 @@ class BaseWindow(BaseLib):
     @property
     def focused(self):
         """Returns `True` is the chrome window is focused"""
-        self.switch_to()
+        self._select()
 
         return self.handle == self._windows.focused_chrome_window_handle
 
@@ -222,7 +497,7 @@ class BaseWindow(BaseLib):
 
         :returns: DOM window element
         """
-        self.switch_to()
+        self._select()
 
         return self.marionette.find_element(By.CSS_SELECTOR, ':root')
 
@@ -230,6 +505,8 @@ class BaseWindow(BaseLib):
         """Closes the current chrome window.
 
         If this is the last remaining window, the marionette session is ended.
+        Otherwise Marionette gets switched to the window which has the focus
+        after closing, because the closed window can't be used anymore.
 
         :param callback: Optional, function to trigger the window to open. It is
          triggered with the current :class:`BaseWindow` as parameter.
@@ -238,27 +515,70 @@ class BaseWindow(BaseLib):
         :param force: Optional, forces the closing of the window by using the Gecko API.
          Defaults to `False`.
         """
-        self.switch_to()
+        def trigger():
+            if force or callback is None:
+                self._windows.close(self.handle)
+            else:
+                callback(self)
 
-        # Bug 1121698
-        # For more stable tests register an observer topic first
-        prev_win_count = len(self.marionette.chrome_window_handles)
+        self._select()
 
-        if self.handle != self.marionette.current_chrome_window_handle:
-            self.switch_to()
+        other_handles = [handle for handle in self.marionette.chrome_window_handles
+                         if handle != self.handle]
 
-        if force or callback is None:
-            self._windows.close(self.handle)
-        else:
-            callback(self)
+        # Closing the last window ends the session, so nothing can be waited for
+        if not other_handles:
+            trigger()
+            self._windows._get_state().forget(self.handle)
+            return
+
+        with self.marionette.using_context('chrome'):
+            # Listen for the window to be closed first, so it can't be missed
+            listener_id = self._add_window_listener(closed_handle=self.handle)
+
+            closed = False
+            try:
+                trigger()
+
+                # The closed window can't run any scripts anymore, so wait in
+                # one of the remaining windows
+                self._windows._get_state().forget(self.handle)
+                self._windows._select(other_handles[0])
 
-        # Bug 1121698
-        # Observer code should let us ditch this wait code
-        wait = Wait(self.marionette)
-        wait.until(lambda m: len(m.chrome_window_handles) == prev_win_count - 1)
+                closed = self._wait_for_window_listener(listener_id)
+            finally:
+                if not closed:
+                    self._remove_window_listener(listener_id)
 
-        # Ensure we wait long enough until the window has been fully loaded
-        sleep(.5)
+            # Continue in the window which got the focus, like a user would
+            self._windows._select(self._windows.focused_chrome_window_handle)
+
+    def do_command(self, command_id):
+        """Fires the given XUL command in the window.
+
+        This runs the `oncommand` handler of the `<command>` element directly,
+        as done for the menuitems and key shortcuts bound to it, but without
+        the need of synthesizing events and having the window focused.
+
+        :param command_id: The id of the `<command>` element, e.g.
+         `cmd_newNavigator`
+        """
+        self._select()
+
+        with self.marionette.using_context('chrome'):
+            found = self.marionette.execute_script("""
+              let command = document.getElementById(arguments[0]);
+              if (!command) {
+                return false;
+              }
+
+              command.doCommand();
+              return true;
+            """, script_args=[command_id])
+
+        if not found:
+            raise NoSuchElementException('Could not find a command with '
+                                         'id "{}"'.format(command_id))
 
     def focus(self):
         """Sets the focus to the current chrome window"""
@@ -295,33 +615,165 @@ class BaseWindow(BaseLib):
 
         :param expected_class: Optional, check for the correct window class
         """
-        # Bug 1121698
-        # For more stable tests register an observer topic first
-        prev_win_count = len(self.marionette.chrome_window_handles)
-
-        self.switch_to()
+        self._select()
         with self.marionette.using_context('chrome'):
-            if callback is not None:
-                callback(self)
-            else:
-                self.marionette.execute_script(""" window.open(); """)
+            # Listen for the new window first, so it can't be missed. Other
+            # windows, like dialogs, are ignored if the window class is known.
+            window_type = getattr(expected_window_class, 'window_type', None)
+            listener_id = self._add_window_listener(window_type=window_type)
+
+            handle = None
+            try:
+                if callback is not None:
+                    callback(self)
+                else:
+                    self.marionette.execute_script(""" window.open(); """)
+
+                handle = self._wait_for_window_listener(listener_id)
+            finally:
+                # Don't leave the listener behind to catch an unrelated window
+                if handle is None:
+                    self._remove_window_listener(listener_id)
+
+        window = self._windows.create_window_instance(handle, expected_window_class)
+        window._select()
 
-        # Bug 1121698
-        # Observer code should let us ditch this wait code
-        wait = Wait(self.marionette)
-        wait.until(lambda m: len(m.chrome_window_handles) == prev_win_count + 1)
+        return window
 
-        # Ensure we wait long enough until the window has been fully loaded
-        sleep(.5)
+    def _add_window_listener(self, window_type=None, closed_handle=None):
+        """Registers a listener for the next chrome window to be opened, or
+        for the current chrome window to be closed.
 
-        # Browser windows will always open top-most (with observers we will get the
-        # right handle directly)
-        handle = self._windows.focused_chrome_window_handle
+        :param window_type: Optional, the `windowtype` of the window to be
+         opened. Windows of other types are ignored.
+        :param closed_handle: Optional, the handle of the current chrome window
+         to listen for its closing instead
 
-        window = self._windows.create_window_instance(handle, expected_window_class)
-        window.switch_to()
+        :returns: The id of the listener
+        """
+        listener_id = str(next(self._listener_ids))
+
+        self.marionette.execute_script("""
+          Cu.import("resource://gre/modules/Services.jsm");
+
+          let [id, windowType, closedHandle] = arguments;
+
+          let hiddenWindow = Services.appShell.hiddenDOMWindow;
+          let listeners = hiddenWindow.puppeteerWindowListeners || {};
+          hiddenWindow.puppeteerWindowListeners = listeners;
+
+          let listener = listeners[id] = {handle: null, resolve: null};
+          let closedWindow = closedHandle ? window : null;
+          let registered = true;
+
+          function unregister() {
+            if (registered) {
+              registered = false;
+              Services.ww.unregisterNotification(observer);
+            }
+          }
+
+          listener.remove = function () {
+            unregister();
+            delete listeners[id];
+          };
+
+          function done(handle) {
+            unregister();
+            listener.handle = handle;
+            if (listener.resolve) {
+              listener.resolve(handle);
+            }
+          }
+
+          function loaded(win) {
+            done(win.QueryInterface(Ci.nsIInterfaceRequestor)
+                    .getInterface(Ci.nsIDOMWindowUtils)
+                    .outerWindowID.toString());
+          }
+
+          function waitForStartup(win) {
+            // Browser windows finish their initialization after the load event
+            if (win.document.documentElement.getAttribute("windowtype") != "navigator:browser") {
+              loaded(win);
+              return;
+            }
+
+            Services.obs.addObserver(function observer(subject) {
+              if (subject == win) {
+                Services.obs.removeObserver(observer, "browser-delayed-startup-finished");
+                loaded(win);
+              }
+            }, "browser-delayed-startup-finished", false);
+          }
+
+          function observer(subject, topic) {
+            if (closedWindow) {
+              if (topic == "domwindowclosed" && subject == closedWindow) {
+                done(closedHandle);
+              }
+              return;
+            }
+
+            if (topic != "domwindowopened") {
+              return;
+            }
+
+            let win = subject.QueryInterface(Ci.nsIDOMWindow);
+            win.addEventListener("load", function onLoad() {
+              win.removeEventListener("load", onLoad);
+
+              // Only take the first window of the expected type
+              let type = win.document.documentElement.getAttribute("windowtype");
+              if (!registered || (windowType && type != windowType)) {
+                return;
+              }
+
+              unregister();
+              waitForStartup(win);
+            });
+          }
+
+          Services.ww.registerNotification(observer);
+        """, script_args=[listener_id, window_type, closed_handle])
+
+        return listener_id
+
+    def _remove_window_listener(self, listener_id):
+        """Unregisters a listener which has not been waited for."""
+        self.marionette.execute_script("""
+          Cu.import("resource://gre/modules/Services.jsm");
+
+          let listener = Services.appShell.hiddenDOMWindow
+                                 .puppeteerWindowListeners[arguments[0]];
+          if (listener) {
+            listener.remove();
+          }
+        """, script_args=[listener_id])
+
+    def _wait_for_window_listener(self, listener_id):
+        """Waits until the chrome window the given listener has been
+        registered for is opened and loaded, or closed.
+
+        :returns: The handle of the window
+        """
+        timeout = Wait(self.marionette).timeout
 
-        return window
+        return self.marionette.execute_async_script("""
+          Cu.import("resource://gre/modules/Services.jsm");
+
+          let id = arguments[0];
+          let listeners = Services.appShell.hiddenDOMWindow.puppeteerWindowListeners;
+
+          listeners[id].resolve = function (handle) {
+            listeners[id].remove();
+            marionetteScriptFinished(handle);
+          };
+
+          if (listeners[id].handle) {
+            listeners[id].resolve(listeners[id].handle);
+          }
+        """, script_args=[listener_id], script_timeout=int(timeout * 1000))
 
     def send_shortcut(self, command_key, **kwargs):
         """Sends a keyboard shortcut to the window
@@ -363,9 +815,14 @@ class BaseWindow(BaseLib):
         # Bug 1125209 - Only lower-case command keys should be sent
         keys.append(command_key.lower())
 
-        self.switch_to()
+        self._select()
         self.window.send_keys(*keys)
 
+    def _select(self):
+        """Switches Marionette to this chrome window, without checking whether
+        it is still open. Any further command would fail for a closed window."""
+        self._windows._select(self.handle)
+
     def switch_to(self, focus=False):
         """Switches the context to this chrome window.
 
@@ -405,7 +862,7 @@ class BrowserWindow(BaseWindow):
     @property
     def is_private(self):
         """Returns True if it is a Private Browsing window."""
-        self.switch_to()
+        self._select()
 
         with self.marionette.using_context('chrome'):
             return self.marionette.execute_script("""
@@ -437,8 +894,8 @@ class BrowserWindow(BaseWindow):
         """Closes the current browser window by using the specified trigger.
 
         :param trigger: Optional, method in how to close the current browser window. This can
-         be a string with one of `menu` or `shortcut`, or a callback which gets triggered
-         with the current :class:`BrowserWindow` as parameter. Defaults to `menu`.
+         be a string with one of `menu`, `shortcut` or `command`, or a callback which gets
+         triggered with the current :class:`BrowserWindow` as parameter. Defaults to `menu`.
 
         :param force: Optional, forces the closing of the window by using the Gecko API.
          Defaults to `False`.
@@ -448,12 +905,12 @@ class BrowserWindow(BaseWindow):
             if callable(trigger):
                 trigger(win)
             elif trigger == 'menu':
-                # TODO: Make use of menubar class once it supports ids
-                menu = win.marionette.find_element('id', 'menu_closeWindow')
-                menu.click()
+                win.menubar.select_by_id('menu_closeWindow')
             elif trigger == 'shortcut':
                 win.send_shortcut(win.get_localized_entity('closeCmd.key'),
                                   accel=True, shift=True)
+            elif trigger == 'command':
+                win.do_command('cmd_closeWindow')
             else:
                 raise errors.InvalidValueError('Unknown closing method: "%s"' % trigger)
 
@@ -463,8 +920,8 @@ class BrowserWindow(BaseWindow):
         """Opens a new browser window by using the specified trigger.
 
         :param trigger: Optional, method in how to open the new browser window. This can
-         be a string with one of `menu` or `shortcut`, or a callback which gets triggered
-         with the current :class:`BrowserWindow` as parameter. Defaults to `menu`.
+         be a string with one of `menu`, `shortcut` or `command`, or a callback which gets
+         triggered with the current :class:`BrowserWindow` as parameter. Defaults to `menu`.
 
         :param is_private: Optional, if True the new window will be a private browsing one.
 
@@ -475,14 +932,14 @@ class BrowserWindow(BaseWindow):
             if callable(trigger):
                 trigger(win)
             elif trigger == 'menu':
-                # TODO: Make use of menubar class once it supports ids
-                menu_id = 'menu_newPrivateWindow' if is_private else 'menu_newNavigator'
-                menu = win.marionette.find_element('id', menu_id)
-                menu.click()
+                win.menubar.select_by_id('menu_newPrivateWindow' if is_private
+                                         else 'menu_newNavigator')
             elif trigger == 'shortcut':
                 cmd_key = 'privateBrowsingCmd.commandkey' if is_private else 'newNavigatorCmd.key'
                 win.send_shortcut(win.get_localized_entity(cmd_key),
                                   accel=True, shift=is_private)
+            elif trigger == 'command':
+                win.do_command('Tools:PrivateBrowsing' if is_private else 'cmd_newNavigator')
             else:
                 raise errors.InvalidValueError('Unknown opening method: "%s"' % trigger)
 
@@ -2,14 +2,103 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import os
+
 from marionette import BaseMarionetteOptions
 
 import firefox_ui_tests
 import firefox_puppeteer
 
+from .impact import verify_revision
+
 
 class ReleaseTestParser(BaseMarionetteOptions):
 
+    def __init__(self, **kwargs):
+        BaseMarionetteOptions.__init__(self, **kwargs)
+
+        self.add_option('--shards', '--jobs',
+                        dest='shards',
+                        type='int',
+                        default=1,
+                        metavar='N',
+                        help='Split the tests across N Firefox instances which '
+                             'are run in parallel. Each instance gets its own '
+                             'profile and Marionette port, while the resources '
+                             'are served by a single server.')
+
+        self.add_option('--durations-file',
+                        dest='durations_file',
+                        metavar='PATH',
+                        help='JSON file to record the duration of each test file '
+                             'in, which is used to balance the shards. Defaults '
+                             'to "test_durations.json" next to the first given '
+                             'test, manifest or directory.')
+
+        self.add_option('--reuse-session',
+                        dest='reuse_session',
+                        action='store_true',
+                        default=False,
+                        help='Keep the Marionette session across tests, and reset '
+                             'the browser state between tests instead. The browser '
+                             'gets restarted if a reset fails, or if a test has '
+                             '"restart = true" set in its manifest.')
+
+        self.add_option('--profile-cache',
+                        dest='profile_cache',
+                        metavar='DIR',
+                        help='Directory to keep profile templates in. A template '
+                             'is built once per Firefox build, and copied into '
+                             'shared memory for each started Firefox instance.')
+
+        self.add_option('--changed-since',
+                        dest='changed_since',
+                        metavar='REV',
+                        help='Only run the tests which are affected by the changes '
+                             'since the given git revision, including uncommitted '
+                             'changes. All other tests are reported as skipped.')
+
+        self.add_option('--usage-index',
+                        dest='usage_index',
+                        metavar='PATH',
+                        help='JSON file to cache which puppeteer code each test '
+                             'uses in, as needed by --changed-since. Defaults to '
+                             '"usage_index.json" next to the durations file.')
+
+        self.add_option('--trace-usage',
+                        dest='trace_usage',
+                        action='store_true',
+                        default=False,
+                        help='Record which puppeteer code gets called by each test '
+                             'in the usage index, in addition to what is found by '
+                             'analyzing the test files.')
+
+        self.add_option('--trace-commands',
+                        dest='trace_commands',
+                        metavar='PATH',
+                        help='Count the Marionette commands, bytes and round-trip '
+                             'times per test and per puppeteer API, and write the '
+                             'report as JSON to PATH.')
+
+        self.add_option('--record',
+                        dest='record',
+                        metavar='PATH',
+                        help='Record all Marionette commands and their responses, '
+                             'and write them as compressed file to PATH.')
+
+        self.add_option('--replay',
+                        dest='replay',
+                        metavar='PATH',
+                        help='Run the tests against the session recorded to PATH '
+                             'by --record instead of a browser, and report the '
+                             'tests and puppeteer APIs which need a different '
+                             'number of round trips than during the recording.')
+
+        self.verify_usage_handlers.append(self.verify_shards_usage)
+        self.verify_usage_handlers.append(self.verify_profile_cache_usage)
+        self.verify_usage_handlers.append(self.verify_replay_usage)
+        self.verify_usage_handlers.append(self.verify_changed_since_usage)
+
     def parse_args(self, *args, **kwargs):
         options, test_files = BaseMarionetteOptions.parse_args(self,
                                                                *args, **kwargs)
@@ -20,4 +109,56 @@ class ReleaseTestParser(BaseMarionetteOptions):
 
         if not test_files:
             test_files = [firefox_puppeteer.manifest, firefox_ui_tests.manifest]
+
+        if not options.durations_file:
+            location = os.path.abspath(test_files[0])
+            if not os.path.isdir(location):
+                location = os.path.dirname(location)
+            options.durations_file = os.path.join(location, 'test_durations.json')
+
+        if not options.usage_index:
+            options.usage_index = os.path.join(os.path.dirname(options.durations_file),
+                                               'usage_index.json')
+
         return (options, test_files)
+
+    def verify_usage(self, options, tests):
+        if not options.replay:
+            return BaseMarionetteOptions.verify_usage(self, options, tests)
+
+        if options.binary or options.address or options.emulator:
+            self.error('Replaying a session cannot be combined with --binary, '
+                       '--address or --emulator.')
+
+        # Replaying a session doesn't need a browser, which the base class
+        # insists on otherwise.
+        options.address = 'localhost:2828'
+        try:
+            BaseMarionetteOptions.verify_usage(self, options, tests)
+        finally:
+            options.address = None
+
+    def verify_shards_usage(self, options, tests):
+        if options.shards < 1:
+            self.error('The number of shards must be a positive integer.')
+
+        if options.shards > 1 and not options.binary:
+            self.error('Running tests in shards requires --binary, so that '
+                       'each shard can start its own Firefox instance.')
+
+    def verify_profile_cache_usage(self, options, tests):
+        if options.profile_cache and options.profile:
+            self.error('A profile template cannot be used together with --profile.')
+
+    def verify_replay_usage(self, options, tests):
+        if options.record and options.replay:
+            self.error('A session cannot be recorded and replayed at the same time.')
+
+        if (options.record or options.replay) and options.shards > 1:
+            self.error('Recording and replaying a session is not supported with shards.')
+
+    def verify_changed_since_usage(self, options, tests):
+        if options.changed_since:
+            error = verify_revision(options.changed_since)
+            if error:
+                self.error('Cannot find the changes for --changed-since: %s' % error)
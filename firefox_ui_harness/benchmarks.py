@@ -0,0 +1,279 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import sys
+import time
+from optparse import OptionParser
+
+from marionette import Marionette
+
+from firefox_puppeteer import Puppeteer
+from firefox_puppeteer.ui.tabbar import Tabs
+
+from .fakeserver import FakeBrowser, FakeMarionetteServer
+
+
+class BenchmarkPuppeteer(Puppeteer):
+    """Puppeteer instance handed to the benchmarks, which also provides the
+    initial window `handles`, and the tab `elements` of the current window."""
+
+    def __init__(self, marionette):
+        Puppeteer.__init__(self)
+        self.set_marionette(marionette)
+
+        self.handles = marionette.chrome_window_handles
+        self.elements = (marionette.find_element('id', 'tabbrowser-tabs')
+                                   .find_elements('tag name', 'tab'))
+
+
+class Benchmark(object):
+    """A single puppeteer operation to measure.
+
+    :param name: Name of the benchmark
+    :param func: Function which runs the operation once, called with the
+     :class:`BenchmarkPuppeteer` instance
+    :param scale: Optional, either `windows` or `tabs` if the benchmark has to
+     be run for each of the window or tab counts
+    :param iterations: Optional, how often to run the operation per measurement
+    :param min_windows: Optional, how many windows the benchmark needs at least
+    """
+
+    def __init__(self, name, func, scale=None, iterations=20, min_windows=1):
+        self.name = name
+        self.func = func
+        self.scale = scale
+        self.iterations = iterations
+        self.min_windows = min_windows
+
+
+def _open_close_tab(puppeteer):
+    puppeteer.windows.current.tabbar.open_tab().close()
+
+
+def _open_close_tabs(puppeteer):
+    tabbar = puppeteer.windows.current.tabbar
+    tabbar.open_tabs(['about:blank'] * 8)
+    tabbar.close_tabs(lambda info: info.index > 0)
+
+
+def _open_close_window(puppeteer, trigger='menu'):
+    browser = puppeteer.windows.current
+    browser.open_browser(trigger=trigger).close(trigger=trigger)
+    browser.switch_to()
+
+
+def _switch_to_other_window(puppeteer):
+    # Switching to the selected window only checks whether it is still open
+    handles = puppeteer.handles
+    if puppeteer.windows.current.handle == handles[0]:
+        puppeteer.windows.switch_to(handles[-1])
+    else:
+        puppeteer.windows.switch_to(handles[0])
+
+
+def _switch_windows(puppeteer):
+    puppeteer.windows.switch_to(puppeteer.handles[0])
+    puppeteer.windows.switch_to(puppeteer.handles[-1])
+
+
+def _focus_windows(puppeteer):
+    puppeteer.windows.focus(puppeteer.handles[0])
+    puppeteer.windows.focus(puppeteer.handles[-1])
+
+
+def _set_restore_pref(puppeteer):
+    puppeteer.prefs.set_pref('browser.startup.homepage', 'about:blank')
+    puppeteer.prefs.restore_pref('browser.startup.homepage')
+
+
+def _wrap_elements(puppeteer):
+    for element in puppeteer.elements:
+        Tabs.TabElement(element)
+
+
+benchmarks = [
+    Benchmark('windows.all', lambda p: p.windows.all, scale='windows'),
+    Benchmark('windows.current', lambda p: p.windows.current),
+    Benchmark('windows.switch_to(handle)', _switch_to_other_window, scale='windows',
+              min_windows=2),
+    Benchmark('windows.switch_to(handle)+back', _switch_windows, scale='windows'),
+    Benchmark('windows.switch_to(callback)',
+              lambda p: p.windows.switch_to(lambda win: win.handle == p.handles[-1]),
+              scale='windows'),
+    Benchmark('windows.switch_to(snapshot)',
+              lambda p: p.windows.switch_to(lambda info: info.handle == p.handles[-1],
+                                            snapshot=True),
+              scale='windows'),
+    Benchmark('windows.focus+back', _focus_windows, scale='windows'),
+    Benchmark('BrowserWindow.open_browser+close', _open_close_window, scale='windows',
+              iterations=2),
+    Benchmark('BrowserWindow.open_browser+close(command)',
+              lambda p: _open_close_window(p, 'command'), scale='windows', iterations=2),
+    Benchmark('Tabs.tabs', lambda p: p.windows.current.tabbar.tabs, scale='tabs'),
+    Benchmark('Tabs.active_tab', lambda p: p.windows.current.tabbar.active_tab, scale='tabs'),
+    Benchmark('Tabs.get_tab(label)', lambda p: p.windows.current.tabbar.get_tab('Last'),
+              scale='tabs'),
+    Benchmark('Tabs.switch_to_tab(index)',
+              lambda p: p.windows.current.tabbar.switch_to_tab(0), scale='tabs'),
+    Benchmark('Tabs.open_tab+close', _open_close_tab, scale='tabs'),
+    Benchmark('Tabs.open_tabs+close_tabs(8)', _open_close_tabs),
+    Benchmark('MenuBar.menus', lambda p: p.windows.current.menubar.menus),
+    Benchmark('MenuBar.select',
+              lambda p: p.windows.current.menubar.select('Edit', 'Select All')),
+    Benchmark('MenuBar.select(command)',
+              lambda p: p.windows.current.menubar.select('Edit', 'Select All',
+                                                         trigger='command')),
+    Benchmark('MenuPanel.click(label)',
+              lambda p: p.windows.current.tabbar.menupanel.popup.click('History')),
+    Benchmark('Preferences.get_pref', lambda p: p.prefs.get_pref('browser.startup.homepage')),
+    Benchmark('Preferences.set_pref+restore_pref', _set_restore_pref),
+    Benchmark('L10n.get_localized_entity',
+              lambda p: p.windows.current.get_localized_entity('closeCmd.key')),
+    Benchmark('DOMElement wrapping', _wrap_elements, iterations=1000),
+]
+
+
+def run_benchmark(benchmark, windows, tabs, latency=0, iterations=None):
+    """Runs a benchmark against a fake browser with the given number of
+    windows and tabs per window.
+
+    :returns: Dictionary with the number of `calls`, and the `round_trips`
+     and `seconds` per call
+    """
+    browser = FakeBrowser(windows=windows, tabs=tabs)
+    for window in browser.windows:
+        window.tabs[-1].label = 'Last'
+
+    server = FakeMarionetteServer(browser, latency=latency)
+    server.start()
+    try:
+        marionette = Marionette(host='localhost', port=server.port)
+        marionette.start_session()
+        marionette.set_context('chrome')
+
+        puppeteer = BenchmarkPuppeteer(marionette)
+
+        # Warm up, so lazily created libraries don't count
+        benchmark.func(puppeteer)
+
+        calls = iterations or benchmark.iterations
+        requests = server.requests
+        start = time.time()
+        for _ in range(calls):
+            benchmark.func(puppeteer)
+        duration = time.time() - start
+        round_trips = server.requests - requests
+
+        marionette.delete_session()
+    finally:
+        server.stop()
+
+    return {
+        'name': benchmark.name,
+        'windows': windows,
+        'tabs': tabs,
+        'calls': calls,
+        'round_trips': float(round_trips) / calls,
+        'seconds': duration / calls,
+    }
+
+
+def run_benchmarks(window_counts, tab_counts, latency=0, iterations=None, names=None):
+    """Runs all benchmarks, each for all counts of the dimension it scales
+    with.
+
+    :returns: List of the results as returned by :func:`run_benchmark`
+    """
+    results = []
+    for benchmark in benchmarks:
+        if names and not any(name in benchmark.name for name in names):
+            continue
+
+        sizes = [(benchmark.min_windows, 1)]
+        if benchmark.scale == 'windows':
+            counts = sorted(set(max(count, benchmark.min_windows) for count in window_counts))
+            sizes = [(count, 1) for count in counts]
+        elif benchmark.scale == 'tabs':
+            sizes = [(benchmark.min_windows, count) for count in tab_counts]
+
+        for windows, tabs in sizes:
+            results.append(run_benchmark(benchmark, windows, tabs, latency, iterations))
+
+    return results
+
+
+def compare_results(results, baseline):
+    """Finds the benchmarks which need more round trips than in the baseline.
+
+    :returns: List of messages for each regression
+    """
+    previous = dict(((r['name'], r['windows'], r['tabs']), r) for r in baseline)
+
+    regressions = []
+    for result in results:
+        old = previous.get((result['name'], result['windows'], result['tabs']))
+        if old and result['round_trips'] > old['round_trips']:
+            regressions.append('%s (%d windows, %d tabs): %.1f round trips, was %.1f' %
+                               (result['name'], result['windows'], result['tabs'],
+                                result['round_trips'], old['round_trips']))
+    return regressions
+
+
+def format_results(results):
+    lines = ['%-48s%-9s%-6s%-13s%s' % ('benchmark', 'windows', 'tabs', 'round trips', 'ms')]
+    for result in results:
+        lines.append('%-48s%-9d%-6d%-13.1f%.3f' % (result['name'], result['windows'],
+                                                   result['tabs'], result['round_trips'],
+                                                   result['seconds'] * 1000))
+    return lines
+
+
+def _parse_counts(value):
+    return [int(count) for count in value.split(',')]
+
+
+def run(args=None):
+    parser = OptionParser(usage='%prog [options] [benchmark names]',
+                          description='Benchmarks the puppeteer libraries against a '
+                                      'fake Marionette server.')
+    parser.add_option('--windows', default='1,4,16',
+                      help='Comma-separated window counts to run benchmarks '
+                           'scaling with windows for. Default: %default')
+    parser.add_option('--tabs', default='1,8,32',
+                      help='Comma-separated tab counts to run benchmarks '
+                           'scaling with tabs for. Default: %default')
+    parser.add_option('--latency', type='float', default=0,
+                      help='Milliseconds to delay each response of the server by.')
+    parser.add_option('--iterations', type='int',
+                      help='How often to run each operation per measurement.')
+    parser.add_option('--output', metavar='PATH',
+                      help='Write the results as JSON to PATH.')
+    parser.add_option('--baseline', metavar='PATH',
+                      help='JSON results of a previous run. Fails if any benchmark '
+                           'needs more round trips than before.')
+    options, names = parser.parse_args(args)
+
+    results = run_benchmarks(_parse_counts(options.windows), _parse_counts(options.tabs),
+                             latency=options.latency / 1000.0,
+                             iterations=options.iterations, names=names)
+    print('\n'.join(format_results(results)))
+
+    if options.output:
+        with open(options.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if options.baseline:
+        with open(options.baseline) as f:
+            regressions = compare_results(results, json.load(f))
+        if regressions:
+            print('\nMore round trips than in the baseline:')
+            print('\n'.join(regressions))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
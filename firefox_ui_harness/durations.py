@@ -0,0 +1,95 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+import tempfile
+
+
+class DurationHistory(object):
+    """Keeps track of how long each test file took to run in previous runs.
+
+    The history is stored as JSON file, and test files are referenced by their
+    path relative to the location of that file. Durations are stored as moving
+    average, so that a single slow run does not disturb scheduling too much.
+
+    :param path: Path of the JSON file to store the history in
+    :param weight: Optional, weight of the latest duration for the moving
+     average. Defaults to `0.5`
+    """
+
+    # Estimate used for unknown tests if no other durations are known yet
+    default_duration = 10.0
+
+    def __init__(self, path, weight=0.5):
+        self.path = os.path.abspath(path)
+        self.weight = weight
+        self.durations = {}
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.durations = json.load(f)
+            except ValueError:
+                # A corrupt history only affects scheduling, so start over
+                self.durations = {}
+
+    def _key(self, filepath):
+        return os.path.relpath(os.path.abspath(filepath),
+                               os.path.dirname(self.path)).replace(os.sep, '/')
+
+    @property
+    def estimate(self):
+        """Returns the duration to assume for tests without any history.
+
+        :returns: Median of all known durations in seconds
+        """
+        known = sorted(self.durations.values())
+        if not known:
+            return self.default_duration
+
+        return known[len(known) // 2]
+
+    def get(self, filepath):
+        """Returns the recorded duration of a test file.
+
+        :param filepath: Path of the test file
+
+        :returns: Duration in seconds, or `None` if the test is unknown
+        """
+        return self.durations.get(self._key(filepath))
+
+    def update(self, durations):
+        """Adds the durations of a test run to the history.
+
+        :param durations: Dictionary of test file paths and their durations
+         in seconds
+        """
+        for filepath, duration in durations.items():
+            key = self._key(filepath)
+            previous = self.durations.get(key)
+            if previous is None:
+                self.durations[key] = duration
+            else:
+                self.durations[key] = (self.weight * duration +
+                                       (1 - self.weight) * previous)
+
+    def save(self):
+        """Writes the history to disk.
+
+        The file gets replaced atomically, so that concurrent runs never see a
+        partially written history.
+        """
+        dirname = os.path.dirname(self.path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.durations, f, indent=2, sort_keys=True)
+
+        # Windows doesn't allow to rename onto an existing file
+        if os.name == 'nt' and os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tmp_path, self.path)
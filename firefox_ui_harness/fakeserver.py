@@ -0,0 +1,792 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import posixpath
+import re
+import socket
+import threading
+import time
+from SocketServer import BaseRequestHandler, ThreadingTCPServer
+
+from marionette.errors import ErrorCodes
+from marionette.keys import Keys
+
+
+def read_message(sock):
+    """Reads a single length-prefixed JSON message from the socket.
+
+    :returns: The decoded message, or `None` if the connection got closed
+    """
+    length = ''
+    while True:
+        char = sock.recv(1)
+        if not char:
+            return None
+        if char == ':':
+            break
+        length += char
+
+    data = ''
+    while len(data) < int(length):
+        chunk = sock.recv(int(length) - len(data))
+        if not chunk:
+            return None
+        data += chunk
+
+    return json.loads(data)
+
+
+def write_message(sock, message):
+    """Writes a single message to the socket, prefixed by its length."""
+    data = json.dumps(message)
+    sock.sendall('%s:%s' % (len(data), data))
+
+
+class FakeError(Exception):
+    """Sent to the client as error response of a command."""
+
+    def __init__(self, status, message):
+        Exception.__init__(self, message)
+        self.status = status
+
+
+class FakeTab(object):
+
+    def __init__(self, url='about:newtab', label='New Tab'):
+        self.url = url
+        self.label = label
+        self.closed = False
+
+
+class FakeWindow(object):
+
+    def __init__(self, handle, is_private=False):
+        self.handle = handle
+        self.is_private = is_private
+        self.window_type = 'navigator:browser'
+        self.closed = False
+
+        self.tabs = [FakeTab()]
+        self.selected_tab = self.tabs[0]
+
+    def open_tab(self, url='about:newtab', label='New Tab'):
+        tab = FakeTab(url, label)
+        self.tabs.append(tab)
+        self.selected_tab = tab
+        return tab
+
+    def close_tab(self, tab):
+        index = self.tabs.index(tab)
+        self.tabs.remove(tab)
+        tab.closed = True
+
+        if tab is self.selected_tab and self.tabs:
+            self.selected_tab = self.tabs[min(index, len(self.tabs) - 1)]
+
+
+class FakeBrowser(object):
+    """Scripted model of the Firefox UI, as far as it is used by the
+    puppeteer libraries.
+
+    Chrome scripts are matched against the registered script handlers by
+    a substring which identifies them. Each handler gets called with the
+    :class:`FakeSession` and the unwrapped script arguments.
+
+    :param windows: Number of browser windows to open initially
+    :param tabs: Number of tabs to open initially in each window
+    """
+
+    # Top-level menus with (label, id, action) of their items
+    menus = [
+        ('File', [('New Tab', 'menu_newNavigatorTab', 'new_tab'),
+                  ('New Window', 'menu_newNavigator', 'new_window'),
+                  ('New Private Window', 'menu_newPrivateWindow', 'new_private_window'),
+                  ('Close Window', 'menu_closeWindow', 'close_window'),
+                  ('Close Tab', 'menu_close', 'close_tab')]),
+        ('Edit', [('Undo', 'menu_undo', None),
+                  ('Redo', 'menu_redo', None),
+                  ('Select All', 'menu_selectAll', None)]),
+        ('View', [('Full Screen', 'fullScreenItem', None)]),
+        ('History', [('Show All History', 'menu_showAllHistory', None)]),
+        ('Bookmarks', [('Show All Bookmarks', 'bookmarksShowAll', None)]),
+        ('Tools', [('Downloads', 'menu_openDownloads', None),
+                   ('Add-ons', 'menu_openAddons', None)]),
+        ('Help', [('About Firefox', 'aboutName', None)]),
+    ]
+
+    # Buttons of the menu panel with their id and action
+    panel_buttons = [
+        ('New Window', 'new-window-button', 'new_window'),
+        ('New Private Window', 'privatebrowsing-button', 'new_private_window'),
+        ('History', 'history-panelmenu', None),
+        ('Preferences', 'preferences-button', None),
+    ]
+
+    # Actions of the <command> elements which can be fired directly
+    commands = {
+        'Browser:OpenLocation': None,
+        'Browser:Reload': None,
+        'Browser:ReloadSkipCache': None,
+        'cmd_close': 'close_tab',
+        'cmd_closeWindow': 'close_window',
+        'cmd_newNavigator': 'new_window',
+        'cmd_newNavigatorTab': 'new_tab',
+        'Tools:PrivateBrowsing': 'new_private_window',
+    }
+
+    entities = {
+        'closeCmd.key': 'W',
+        'newNavigatorCmd.key': 'N',
+        'privateBrowsingCmd.commandkey': 'P',
+        'tabCmd.commandkey': 't',
+    }
+
+    def __init__(self, windows=1, tabs=1):
+        self.lock = threading.RLock()
+
+        self.windows = []
+        self.focused = None
+        self._next_handle = 3
+
+        # Maps the ids of window listeners to the number of windows opened
+        # before they have been registered
+        self.window_listeners = {}
+
+        # Maps the ids of tab listeners to the event type, the tab, and the
+        # tabs of the window when they have been registered, or for page
+        # loads to the expected URL
+        self.tab_listeners = {}
+
+        self.default_prefs = {'browser.startup.homepage': 'about:home'}
+        self.user_prefs = {}
+
+        self.script_handlers = []
+        self.register_default_handlers()
+
+        for _ in range(windows):
+            window = self.open_window()
+            for _ in range(tabs - 1):
+                window.open_tab()
+
+    @property
+    def open_windows(self):
+        return [win for win in self.windows if not win.closed]
+
+    def get_window(self, handle):
+        for window in self.open_windows:
+            if window.handle == handle:
+                return window
+        raise FakeError(ErrorCodes.NO_SUCH_WINDOW, 'No such window: %s' % handle)
+
+    def open_window(self, is_private=False):
+        window = FakeWindow(str(self._next_handle), is_private)
+        self._next_handle += 6
+        self.windows.append(window)
+        self.focused = window
+        return window
+
+    def close_window(self, window):
+        window.closed = True
+        for tab in window.tabs:
+            tab.closed = True
+
+        if self.focused is window:
+            remaining = self.open_windows
+            self.focused = remaining[-1] if remaining else None
+
+    def get_pref(self, name, default_branch=False):
+        if not default_branch and name in self.user_prefs:
+            return self.user_prefs[name]
+        return self.default_prefs.get(name)
+
+    def register_script(self, marker, handler):
+        """Registers a handler for all chrome scripts containing `marker`.
+
+        Handlers registered later take precedence.
+
+        :param marker: Substring which identifies the script
+        :param handler: Function called with the session and the script
+         arguments, which returns the result of the script
+        """
+        self.script_handlers.insert(0, (marker, handler))
+
+    def register_default_handlers(self):
+        def window_open(session, args):
+            session.browser.open_window()
+
+        def most_recent_window(session, args):
+            return session.browser.focused.handle
+
+        def window_focus(session, args):
+            session.browser.focused = session.window
+
+        def wait_for_focus(session, args):
+            session.browser.focused = session.window
+            return True
+
+        def is_private(session, args):
+            return args[0].window.is_private
+
+        def tab_selected(session, args):
+            tab = args[0].target
+            return 'true' if tab is args[0].window.selected_tab else None
+
+        def get_pref(session, args):
+            return session.browser.get_pref(args[0], args[1])
+
+        def reset_pref(session, args):
+            return session.browser.user_prefs.pop(args[0], None) is not None
+
+        def set_pref(session, args):
+            session.browser.user_prefs[args[0]] = args[1]
+            return True
+
+        def localized_entity(session, args):
+            entity_id = re.search(r'&([^;]+);</elem>', args[0]).group(1)
+            return session.browser.entities.get(entity_id, entity_id)
+
+        def localized_property(session, args):
+            return 'property:%s' % args[1]
+
+        def add_window_listener(session, args):
+            if args[2]:
+                session.browser.window_listeners[args[0]] = session.window
+            else:
+                session.browser.window_listeners[args[0]] = len(session.browser.windows)
+
+        def remove_window_listener(session, args):
+            session.browser.window_listeners.pop(args[0], None)
+
+        def window_listener_ids(session, args):
+            return list(session.browser.window_listeners)
+
+        def wait_for_window_listener(session, args):
+            listener = session.browser.window_listeners.pop(args[0])
+            if isinstance(listener, FakeWindow):
+                if not listener.closed:
+                    raise FakeError(ErrorCodes.SCRIPT_TIMEOUT, 'The window has not been closed')
+                return listener.handle
+            if listener >= len(session.browser.windows):
+                raise FakeError(ErrorCodes.SCRIPT_TIMEOUT, 'No window has been opened')
+            return session.browser.windows[listener].handle
+
+        def add_tab_listener(session, args):
+            tab = args[2].target if args[2] else None
+            session.browser.tab_listeners[args[0]] = (args[1], tab, list(session.window.tabs))
+            return True
+
+        def add_page_load_listener(session, args):
+            session.browser.tab_listeners[args[0]] = ('load', None, args[1])
+
+        def remove_tab_listener(session, args):
+            session.browser.tab_listeners.pop(args[0], None)
+
+        def tab_listener_ids(session, args):
+            return list(session.browser.tab_listeners)
+
+        def wait_for_tab_listener(session, args):
+            event, tab, tabs = session.browser.tab_listeners.pop(args[0])
+            window = session.window
+            if event == 'TabClose' and tab.closed:
+                return None
+            elif event == 'TabOpen':
+                opened = [tab for tab in window.tabs if tab not in tabs]
+                if opened:
+                    return FakeElement('tab', window, opened[0], opened[0].label)
+            elif event == 'TabSelect' and (tab is None or tab is window.selected_tab):
+                tab = window.selected_tab
+                return FakeElement('tab', window, tab, tab.label)
+            elif event == 'load':
+                # Pages are not loaded, so the expected URL is reported if given
+                return tabs or window.selected_tab.url
+            raise FakeError(ErrorCodes.SCRIPT_TIMEOUT, 'No %s event has happened' % event)
+
+        def open_tabs(session, args):
+            window = session.window
+            selected_tab = window.selected_tab
+            # Label the tabs like the titles of the test pages, e.g. "Mozilla Mission"
+            tabs = [window.open_tab(url, posixpath.splitext(posixpath.basename(url))[0]
+                                    .replace('_', ' ').title())
+                    for url in args[0]]
+            window.selected_tab = selected_tab
+            return [FakeElement('tab', window, tab, tab.label) for tab in tabs]
+
+        def close_tabs(session, args):
+            for element in args[0]:
+                element.window.close_tab(element.target)
+            return True
+
+        def menubar_snapshot(session, args):
+            # Menus are never shown, so their items don't change
+            if args[0] == 0:
+                return {'generation': 0, 'menus': None}
+            window = session.window
+
+            def serialize(element, items=()):
+                return {'id': element.target, 'label': element.label, 'accesskey': None,
+                        'command': None, 'disabled': False, 'element': element,
+                        'items': list(items)}
+
+            return {'generation': 0,
+                    'menus': [serialize(FakeElement('menu', window, None, menu_label),
+                                        [serialize(FakeElement('menuitem', window, item_id,
+                                                               label, action))
+                                         for label, item_id, action in items])
+                              for menu_label, items in session.browser.menus]}
+
+        def panel_buttons(session, args):
+            if args[0] == 0:
+                return {'generation': 0, 'buttons': None}
+            window = session.window
+            return {'generation': 0,
+                    'buttons': [{'id': button_id,
+                                 'label': label,
+                                 'disabled': False,
+                                 'element': FakeElement('panel-button', window, None,
+                                                        label, action)}
+                                for label, button_id, action in session.browser.panel_buttons]}
+
+        def tab_snapshot(session, args):
+            window = session.window
+            return [{'index': index,
+                     'label': tab.label,
+                     'selected': tab is window.selected_tab,
+                     'pinned': False,
+                     'busy': False,
+                     'url': tab.url,
+                     'element': FakeElement('tab', window, tab, tab.label)}
+                    for index, tab in enumerate(window.tabs)]
+
+        def do_command(session, args):
+            if isinstance(args[0], FakeElement):
+                action = args[0].action
+            elif args[0] in session.browser.commands:
+                action = session.browser.commands[args[0]]
+            else:
+                return False
+            if action:
+                session.browser.run_action(session, action)
+            return True
+
+        def close_windows(session, args):
+            for window in session.browser.open_windows:
+                if window.handle not in args[0]:
+                    session.browser.close_window(window)
+            return []
+
+        def window_snapshot(session, args):
+            return [{'handle': win.handle,
+                     'window_type': win.window_type,
+                     'is_private': win.is_private,
+                     'focused': win is session.browser.focused,
+                     'url': win.selected_tab.url,
+                     'title': win.selected_tab.label,
+                     'tab_count': len(win.tabs)}
+                    for win in session.browser.open_windows]
+
+        self.register_script('window.open()', window_open)
+        self.register_script('getMostRecentWindow', most_recent_window)
+        self.register_script('window.focus()', window_focus)
+        self.register_script('isWindowPrivate', is_private)
+        self.register_script("getAttribute('selected')", tab_selected)
+        self.register_script('getDefaultBranch', get_pref)
+        self.register_script('clearUserPref', reset_pref)
+        self.register_script('setBoolPref', set_pref)
+        self.register_script('nsIDOMParser', localized_entity)
+        self.register_script('createBundle', localized_property)
+        self.register_script('getEnumerator', window_snapshot)
+        self.register_script('listeners[id].resolve', wait_for_window_listener)
+        self.register_script('puppeteerWindowListeners[arguments[0]]', remove_window_listener)
+        self.register_script('Object.keys(listeners', window_listener_ids)
+        self.register_script('domwindowclosed', close_windows)
+        self.register_script('puppeteerWindowListeners || {}', add_window_listener)
+        self.register_script('"activate"', wait_for_focus)
+        self.register_script('linkedBrowser.currentURI', tab_snapshot)
+        self.register_script('window.puppeteerTabListeners[id] = {', add_tab_listener)
+        self.register_script('tabListeners[id].resolve', wait_for_tab_listener)
+        self.register_script('addTabsProgressListener', open_tabs)
+        self.register_script('tabsToClose', close_tabs)
+        self.register_script('puppeteerGeneration', panel_buttons)
+        self.register_script('serializeMenu', menubar_snapshot)
+        self.register_script('onPageShow', add_page_load_listener)
+        self.register_script('puppeteerTabListeners || {})', remove_tab_listener)
+        self.register_script('Object.keys(window.puppeteerTabListeners', tab_listener_ids)
+        self.register_script('doCommand()', do_command)
+
+    def run_action(self, session, action):
+        window = session.window
+        if action == 'new_tab':
+            window.open_tab()
+        elif action == 'close_tab':
+            window.close_tab(window.selected_tab)
+        elif action == 'new_window':
+            self.open_window()
+        elif action == 'new_private_window':
+            self.open_window(is_private=True)
+        elif action == 'close_window':
+            self.close_window(window)
+
+
+class FakeElement(object):
+    """Element of the fake browser UI.
+
+    :param kind: Type of the element, e.g. `tab` or `menuitem`
+    :param window: The :class:`FakeWindow` the element belongs to
+    :param target: Model object represented by the element
+    :param label: Value of the `label` attribute
+    :param action: Action to run when clicked
+    """
+
+    def __init__(self, kind, window, target=None, label=None, action=None, tag=None):
+        self.kind = kind
+        self.window = window
+        self.target = target
+        self.label = label
+        self.action = action
+        self.tag = tag or kind
+
+    @property
+    def stale(self):
+        return self.window.closed or getattr(self.target, 'closed', False)
+
+
+class FakeSession(object):
+    """State of a single client connection, and the command handlers."""
+
+    def __init__(self, server):
+        self.server = server
+        self.browser = server.browser
+        self.context = 'content'
+        self.session_id = None
+
+        focused = self.browser.focused
+        self.window_handle = focused.handle if focused else None
+
+    @property
+    def window(self):
+        return self.browser.get_window(self.window_handle)
+
+    # Element handling
+
+    def element_id(self, element):
+        key = (element.kind, element.window, element.target, element.label)
+        with self.server.lock:
+            element_id = self.server.element_ids.get(key)
+            if element_id is None:
+                element_id = '{fake-%d}' % len(self.server.element_ids)
+                self.server.element_ids[key] = element_id
+                self.server.elements[element_id] = element
+        return {'ELEMENT': element_id}
+
+    def get_element(self, element_id):
+        element = self.server.elements.get(element_id)
+        if element is None:
+            raise FakeError(ErrorCodes.NO_SUCH_ELEMENT, 'Unknown element: %s' % element_id)
+        if element.stale:
+            raise FakeError(ErrorCodes.STALE_ELEMENT_REFERENCE, 'Element is stale')
+        return element
+
+    def find(self, using, value, parent=None):
+        window = self.window
+        kind = parent.kind if parent else None
+
+        found = []
+        if using == 'id' and kind is None:
+            if value == 'tabbrowser-tabs':
+                found = [FakeElement('tabs', window, tag='tabs')]
+            elif value == 'main-menubar':
+                found = [FakeElement('menubar', window, tag='menubar')]
+            elif value == 'PanelUI-popup':
+                found = [FakeElement('panel', window, tag='panel')]
+            else:
+                for menu_label, items in self.browser.menus:
+                    for label, item_id, action in items:
+                        if item_id == value:
+                            found = [FakeElement('menuitem', window, item_id, label, action)]
+        elif using == 'css selector' and value == ':root' and kind is None:
+            found = [FakeElement('root', window, tag='window')]
+        elif kind == 'tabs' and using == 'tag name' and value == 'tab':
+            found = [FakeElement('tab', window, tab, tab.label) for tab in window.tabs]
+        elif kind == 'tabs' and using == 'anon attribute':
+            found = [FakeElement('newtab', window, tag='toolbarbutton', action='new_tab')]
+        elif kind == 'tab' and using == 'anon':
+            found = [FakeElement('tab-anon', window, parent.target, tag='hbox')]
+        elif kind == 'tab-anon' and value == 'tab-close-button':
+            found = [FakeElement('tab-close', window, parent.target, tag='toolbarbutton')]
+        elif kind == 'menubar' and using == 'tag name' and value == 'menu':
+            found = [FakeElement('menu', window, None, label)
+                     for label, items in self.browser.menus]
+        elif kind == 'menu' and using == 'tag name' and value == 'menupopup':
+            found = [FakeElement('menupopup', window, None, parent.label)]
+        elif kind == 'menupopup' and using == 'tag name' and value == 'menuitem':
+            items = dict(self.browser.menus)[parent.label]
+            found = [FakeElement('menuitem', window, item_id, label, action)
+                     for label, item_id, action in items]
+        elif kind == 'panel' and using == 'id' and value == 'PanelUI-multiView':
+            found = [FakeElement('panel-multiview', window, tag='panelmultiview')]
+        elif kind == 'panel-multiview' and using == 'anon attribute':
+            found = [FakeElement('panel-container', window, tag='box')]
+        elif kind == 'panel-container' and using == 'tag name' and value == 'toolbarbutton':
+            found = [FakeElement('panel-button', window, None, label, action)
+                     for label, button_id, action in self.browser.panel_buttons]
+
+        return found
+
+    def wrap(self, value):
+        if isinstance(value, FakeElement):
+            return self.element_id(value)
+        if isinstance(value, list):
+            return [self.wrap(item) for item in value]
+        if isinstance(value, dict):
+            return dict((key, self.wrap(item)) for key, item in value.items())
+        return value
+
+    def unwrap(self, value):
+        if isinstance(value, dict) and 'ELEMENT' in value:
+            return self.get_element(value['ELEMENT'])
+        if isinstance(value, list):
+            return [self.unwrap(item) for item in value]
+        return value
+
+    # Commands
+
+    def run_command(self, name, params):
+        method = getattr(self, 'cmd_%s' % name, None)
+        if method is None:
+            raise FakeError(ErrorCodes.UNKNOWN_COMMAND, 'Unknown command: %s' % name)
+        return method(**params)
+
+    def cmd_newSession(self, **params):
+        self.session_id = 'fake-session-%d' % id(self)
+        return {'value': self.server.capabilities, 'sessionId': self.session_id}
+
+    def cmd_getSessionCapabilities(self, **params):
+        return {'value': self.server.capabilities}
+
+    def cmd_deleteSession(self, **params):
+        self.session_id = None
+        return {'ok': True}
+
+    def _ok(self, **params):
+        return {'ok': True}
+
+    cmd_setTestName = cmd_setScriptTimeout = cmd_setSearchTimeout = _ok
+    cmd_timeouts = cmd_log = _ok
+
+    def cmd_getLogs(self, **params):
+        return {'value': []}
+
+    def cmd_getContext(self, **params):
+        return {'value': self.context}
+
+    def cmd_setContext(self, value, **params):
+        self.context = value
+        return {'ok': True}
+
+    def cmd_getChromeWindowHandles(self, **params):
+        return {'value': [win.handle for win in self.browser.open_windows]}
+
+    cmd_getWindowHandles = cmd_getChromeWindowHandles
+
+    def cmd_getCurrentChromeWindowHandle(self, **params):
+        # Like Marionette, keep reporting the handle of a closed window
+        return {'value': self.window_handle}
+
+    cmd_getWindowHandle = cmd_getCurrentChromeWindowHandle
+
+    def cmd_switchToWindow(self, name, **params):
+        self.window_handle = self.browser.get_window(name).handle
+        return {'ok': True}
+
+    def cmd_getWindowType(self, **params):
+        return {'value': self.window.window_type}
+
+    def cmd_closeChromeWindow(self, **params):
+        self.browser.close_window(self.window)
+        return {'ok': True}
+
+    def cmd_close(self, **params):
+        window = self.window
+        window.close_tab(window.selected_tab)
+        if not window.tabs:
+            self.browser.close_window(window)
+        return {'ok': True}
+
+    def cmd_get(self, url, **params):
+        tab = self.window.selected_tab
+        tab.url = url
+        tab.label = url.rsplit('/', 1)[-1] or url
+        return {'ok': True}
+
+    def cmd_getCurrentUrl(self, **params):
+        return {'value': self.window.selected_tab.url}
+
+    def cmd_getTitle(self, **params):
+        return {'value': self.window.selected_tab.label}
+
+    def cmd_findElement(self, using, value, element=None, **params):
+        parent = self.get_element(element) if element else None
+        found = self.find(using, value, parent)
+        if not found:
+            raise FakeError(ErrorCodes.NO_SUCH_ELEMENT,
+                            'Unable to locate element: %s' % value)
+        return {'value': self.element_id(found[0])}
+
+    def cmd_findElements(self, using, value, element=None, **params):
+        parent = self.get_element(element) if element else None
+        return {'value': [self.element_id(found) for found in
+                          self.find(using, value, parent)]}
+
+    def cmd_getElementAttribute(self, id, name, **params):
+        element = self.get_element(id)
+        if name == 'label':
+            return {'value': element.label}
+        if name == 'selected' and element.kind == 'tab':
+            return {'value': 'true' if element.target is element.window.selected_tab else None}
+        if name == 'id':
+            return {'value': element.target if element.kind == 'menuitem' else None}
+        return {'value': None}
+
+    def cmd_getElementTagName(self, id, **params):
+        return {'value': self.get_element(id).tag}
+
+    def cmd_clickElement(self, id, **params):
+        element = self.get_element(id)
+        if element.kind == 'tab':
+            element.window.selected_tab = element.target
+        elif element.kind == 'tab-close':
+            element.window.close_tab(element.target)
+        elif element.action:
+            self.browser.run_action(self, element.action)
+        return {'ok': True}
+
+    def cmd_sendKeysToElement(self, id, value, **params):
+        self.get_element(id)
+        keys = ''.join(value)
+        accel = Keys.CONTROL in keys or Keys.META in keys
+        letter = keys[-1:].lower()
+
+        if accel and Keys.SHIFT in keys:
+            action = {'p': 'new_private_window', 'w': 'close_window'}.get(letter)
+        elif accel:
+            action = {'n': 'new_window', 't': 'new_tab', 'w': 'close_tab'}.get(letter)
+        else:
+            action = None
+
+        if action:
+            self.browser.run_action(self, action)
+        return {'ok': True}
+
+    def cmd_executeScript(self, script, args=None, **params):
+        args = self.unwrap(args or [])
+        for marker, handler in self.browser.script_handlers:
+            if marker in script:
+                return {'value': self.wrap(handler(self, args))}
+
+        raise FakeError(ErrorCodes.JAVASCRIPT_ERROR,
+                        'No fake handler for script: %s' % script.strip()[:80])
+
+    cmd_executeAsyncScript = cmd_executeScript
+
+
+class FakeRequestHandler(BaseRequestHandler):
+
+    def handle(self):
+        server = self.server
+        session = FakeSession(server)
+
+        try:
+            write_message(self.request, {'from': 'root', 'applicationType': 'gecko',
+                                         'traits': []})
+        except socket.error:
+            # Clients waiting for the port close the connection right away
+            return
+
+        while True:
+            try:
+                message = read_message(self.request)
+            except socket.error:
+                return
+            if message is None:
+                return
+
+            with server.lock:
+                server.requests += 1
+            if server.latency:
+                time.sleep(server.latency)
+
+            actor = 'conn0.marionette'
+            name = message.get('name')
+            if name == 'getMarionetteID':
+                response = {'from': 'root', 'id': actor}
+            else:
+                with server.browser.lock:
+                    try:
+                        response = session.run_command(name, message.get('parameters', {}))
+                    except FakeError as e:
+                        response = {'error': {'status': e.status, 'message': str(e)}}
+                response['from'] = actor
+
+            try:
+                write_message(self.request, response)
+            except socket.error:
+                return
+
+
+class FakeMarionetteServer(ThreadingTCPServer):
+    """Stand-in for the Marionette server of Firefox, which speaks the same
+    wire protocol, and answers the commands from a :class:`FakeBrowser`.
+
+    Usage example::
+
+      server = FakeMarionetteServer(FakeBrowser(windows=2))
+      server.start()
+
+      marionette = Marionette(host='localhost', port=server.port)
+      marionette.start_session()
+
+    :param browser: The :class:`FakeBrowser` to use
+    :param latency: Optional, seconds to delay each response by
+    :param host: Optional, host to bind to. Defaults to `localhost`
+    :param port: Optional, port to bind to. Defaults to a free port
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    capabilities = {
+        'browserName': 'Firefox',
+        'browserVersion': '38.0',
+        'device': 'desktop',
+        'platformName': 'LINUX',
+        'platformVersion': '1.0',
+    }
+
+    def __init__(self, browser=None, latency=0, host='localhost', port=0):
+        ThreadingTCPServer.__init__(self, (host, port), FakeRequestHandler)
+
+        self.browser = browser or FakeBrowser()
+        self.latency = latency
+        self.requests = 0
+
+        self.lock = threading.Lock()
+        self.element_ids = {}
+        self.elements = {}
+
+        self._thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
@@ -0,0 +1,479 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+import firefox_puppeteer
+import firefox_ui_tests
+
+
+here = os.path.abspath(os.path.dirname(__file__))
+
+# Puppeteer modules every library depends on. Changes to those affect all tests.
+core_modules = [os.path.join(firefox_puppeteer.root, name)
+                for name in ('__init__.py', 'base.py', 'decorators.py')]
+
+# Harness module whose usage of puppeteer applies to each test
+testcase_module = os.path.join(here, 'testcase.py')
+
+
+def is_library(filepath):
+    """Checks if the file is a puppeteer module, but not a test or docs."""
+    # Code objects have relative paths if imported via a relative sys.path entry
+    filepath = os.path.abspath(filepath)
+    if not filepath.startswith(firefox_puppeteer.root + os.sep) or not filepath.endswith('.py'):
+        return False
+    folder = os.path.relpath(filepath, firefox_puppeteer.root).split(os.sep)[0]
+    return folder not in ('docs', 'tests')
+
+
+def get_stamp(filepath):
+    """Returns a value which changes whenever the file gets modified."""
+    stat = os.stat(filepath)
+    return [stat.st_mtime, stat.st_size]
+
+
+def parse_usage(filepath):
+    """Collects the names a test file refers to, including all attribute
+    names and imported names, and all string constants which look like a path.
+
+    :param filepath: Path of the test file
+
+    :returns: Tuple of a list of names and a list of path-like strings
+    """
+    with open(filepath) as f:
+        tree = ast.parse(f.read(), filepath)
+
+    names = set()
+    strings = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute):
+            names.add(node.attr)
+        elif isinstance(node, ast.Name):
+            names.add(node.id)
+        elif isinstance(node, ast.alias):
+            names.add((node.asname or node.name).split('.')[-1])
+        elif isinstance(node, ast.Str) and '/' in node.s and len(node.s) < 200:
+            strings.add(node.s)
+
+    return sorted(names), sorted(strings)
+
+
+def _get_refs(nodes):
+    refs = set()
+    for node in nodes:
+        for child in ast.walk(node):
+            if isinstance(child, ast.Attribute):
+                refs.add(child.attr)
+            elif isinstance(child, ast.Name):
+                refs.add(child.id)
+            elif isinstance(child, ast.Str) and child.s.startswith(('ui.', 'api.')):
+                # Libraries referenced by `use_class_as_property`
+                refs.add(child.s.split('.')[-1])
+    return refs
+
+
+def _get_start(node):
+    decorators = getattr(node, 'decorator_list', [])
+    return min([node.lineno] + [d.lineno for d in decorators])
+
+
+def _collect_symbols(body, prefix, end, symbols):
+    for index, node in enumerate(body):
+        start = _get_start(node)
+        if index + 1 < len(body):
+            stop = _get_start(body[index + 1]) - 1
+        else:
+            stop = end
+
+        if isinstance(node, ast.ClassDef):
+            name = prefix + node.name
+            # The class header covers everything up to its first member
+            header_end = _get_start(node.body[0]) - 1 if node.body else stop
+            symbols.append([name, start, max(start, header_end), sorted(_get_refs(node.bases))])
+            _collect_symbols(node.body, name + '.', stop, symbols)
+        elif isinstance(node, ast.FunctionDef):
+            symbols.append([prefix + node.name, start, stop, sorted(_get_refs([node]))])
+        elif isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    symbols.append([prefix + target.id, start, stop,
+                                    sorted(_get_refs([node.value]))])
+        elif not prefix:
+            # Imports and other module-level code
+            symbols.append(['', start, stop, []])
+
+
+def parse_symbols(filepath):
+    """Collects all classes, functions, methods, and attributes defined in a
+    puppeteer module, together with the lines they span and the names they
+    refer to.
+
+    Each symbol spans all the lines up to the next symbol, so that comments
+    and blank lines in between are attributed to the preceding symbol.
+
+    :param filepath: Path of the puppeteer module
+
+    :returns: List of `[qualified name, first line, last line, names]`
+    """
+    with open(filepath) as f:
+        source = f.read()
+    tree = ast.parse(source, filepath)
+
+    symbols = []
+    _collect_symbols(tree.body, '', source.count('\n') + 1, symbols)
+    return symbols
+
+
+def find_symbol(symbols, lineno):
+    """Returns the innermost symbol which spans the given line.
+
+    :param symbols: List of symbols as returned by :func:`parse_symbols`
+    :param lineno: Line number in the module
+
+    :returns: The qualified name, or `None` if no symbol spans the line
+    """
+    found = None
+    for name, start, end, refs in symbols:
+        if start <= lineno <= end:
+            if found is None or name.count('.') >= found.count('.'):
+                found = name
+    return found
+
+
+def get_git_root():
+    """Returns the root folder of the git checkout the puppeteer package is
+    part of, or `None` if it has not been installed from a checkout."""
+    try:
+        with open(os.devnull, 'w') as devnull:
+            return subprocess.check_output(['git', 'rev-parse', '--show-toplevel'],
+                                           cwd=firefox_puppeteer.root,
+                                           stderr=devnull).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def verify_revision(rev):
+    """Checks whether the changes since the given revision can be retrieved.
+
+    :param rev: The git revision to compare with
+
+    :returns: A message why the revision can't be used, or `None`
+    """
+    root = get_git_root()
+    if root is None:
+        return 'The puppeteer package is not part of a git checkout.'
+
+    with open(os.devnull, 'w') as devnull:
+        found = subprocess.call(['git', 'rev-parse', '--verify', '--quiet',
+                                 '%s^{commit}' % rev],
+                                cwd=root, stdout=devnull, stderr=devnull) == 0
+    if not found:
+        return 'Unknown git revision "%s".' % rev
+    return None
+
+
+def _parse_diff_path(value):
+    """Returns the path of a `---` or `+++` line of a diff without its `a/`
+    or `b/` prefix, or `None` for `/dev/null`."""
+    # Paths containing spaces are terminated by a tab, and paths containing
+    # special characters are quoted like C strings
+    if value.endswith('\t'):
+        value = value[:-1]
+    if value == '/dev/null':
+        return None
+    if value.startswith('"'):
+        value = value[1:-1].decode('string_escape')
+    return value[2:]
+
+
+def get_changed_lines(rev, root):
+    """Retrieves the lines which have been changed since the given revision,
+    including uncommitted changes. All lines of untracked files, which are
+    not ignored, count as changed.
+
+    :param rev: The git revision to compare with
+    :param root: Root folder of the git repository
+
+    :returns: Dictionary of absolute file paths and the set of changed line
+     numbers in the current version of the file. Deleted files have `None`
+     assigned.
+    """
+    # Renamed files are reported as removed and added, so that the references
+    # to the old module are noticed
+    output = subprocess.check_output(['git', 'diff', '-U0', '--no-color', '--no-renames',
+                                      '--src-prefix=a/', '--dst-prefix=b/', rev, '--'],
+                                     cwd=root)
+
+    changes = {}
+    filepath = None
+    old_path = None
+    in_header = False
+    for line in output.splitlines():
+        if line.startswith('diff '):
+            in_header = True
+            filepath = None
+        elif in_header and line.startswith('--- '):
+            old_path = _parse_diff_path(line[4:])
+        elif in_header and line.startswith('+++ '):
+            target = _parse_diff_path(line[4:])
+            if target is None:
+                # Use the old name of the file which has been deleted
+                changes[os.path.join(root, old_path)] = None
+            else:
+                filepath = os.path.join(root, target)
+                changes.setdefault(filepath, set())
+        elif line.startswith('@@'):
+            in_header = False
+            if filepath:
+                match = re.match(r'@@ -\S+ \+(\d+)(?:,(\d+))? @@', line)
+                start = int(match.group(1))
+                count = int(match.group(2) or 1)
+                # Pure deletions are reported as zero lines after the given one
+                changes[filepath].update(range(start, start + max(count, 1)))
+
+    output = subprocess.check_output(['git', 'ls-files', '-z', '--others',
+                                      '--exclude-standard', '--full-name'], cwd=root)
+    for name in output.split('\0'):
+        if not name:
+            continue
+        filepath = os.path.join(root, name)
+        with open(filepath) as f:
+            changes[filepath] = set(range(1, len(f.readlines()) + 1))
+
+    return changes
+
+
+class UsageIndex(object):
+    """Index of which names each test file uses, and which symbols each
+    puppeteer module defines.
+
+    The index is stored as JSON file, and entries are only updated for files
+    which have been modified since they were indexed. In addition to the
+    static analysis of the test files, the puppeteer symbols called while
+    running a test can be recorded by :class:`UsageTracer`.
+
+    :param path: Path of the JSON file to store the index in
+    """
+
+    version = 1
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.data = {'version': self.version, 'tests': {}, 'modules': {}}
+
+        if os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    data = json.load(f)
+                if data.get('version') == self.version:
+                    self.data = data
+            except ValueError:
+                pass
+
+    def _get_entry(self, section, filepath, parser):
+        entry = self.data[section].get(filepath)
+        stamp = get_stamp(filepath)
+        if entry is None or entry['stamp'] != stamp:
+            entry = {'stamp': stamp, 'traced': []}
+            entry.update(parser(filepath))
+            self.data[section][filepath] = entry
+        return entry
+
+    def get_usage(self, filepath):
+        """Returns the usage entry of a test file, which contains the `names`
+        and `strings` it uses, and the `traced` puppeteer symbols."""
+        def parser(path):
+            names, strings = parse_usage(path)
+            return {'names': names, 'strings': strings}
+        return self._get_entry('tests', os.path.abspath(filepath), parser)
+
+    def get_symbols(self, filepath):
+        """Returns the symbols of a puppeteer module as returned by
+        :func:`parse_symbols`."""
+        def parser(path):
+            return {'symbols': parse_symbols(path)}
+        return self._get_entry('modules', os.path.abspath(filepath), parser)['symbols']
+
+    def add_traced(self, filepath, calls):
+        """Stores the puppeteer symbols which have been called by a test.
+
+        :param filepath: Path of the test file
+        :param calls: List of `(module path, line number)` tuples of the
+         functions which have been called
+        """
+        symbols = set()
+        for module, lineno in calls:
+            if is_library(module) and os.path.exists(module):
+                name = find_symbol(self.get_symbols(module), lineno)
+                if name:
+                    symbols.add('%s:%s' % (os.path.relpath(module, firefox_puppeteer.root),
+                                           name))
+
+        self.get_usage(filepath)['traced'] = sorted(symbols)
+
+    def save(self):
+        dirname = os.path.dirname(self.path)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.data, f)
+
+        # Windows doesn't allow to rename onto an existing file
+        if os.name == 'nt' and os.path.exists(self.path):
+            os.remove(self.path)
+        os.rename(tmp_path, self.path)
+
+
+class UsageTracer(object):
+    """Records which puppeteer functions get called, by using a profile
+    function.
+
+    Usage example::
+
+      with UsageTracer() as tracer:
+          run_the_test()
+      print tracer.calls
+    """
+
+    def __init__(self):
+        self.calls = set()
+        self._previous = None
+
+    def _profile(self, frame, event, arg):
+        if event == 'call':
+            code = frame.f_code
+            if code.co_filename.startswith(firefox_puppeteer.root):
+                self.calls.add((code.co_filename, code.co_firstlineno))
+
+    def __enter__(self):
+        self._previous = sys.getprofile()
+        sys.setprofile(self._profile)
+        return self
+
+    def __exit__(self, *args):
+        sys.setprofile(self._previous)
+
+
+class ChangeSet(object):
+    """The changes since a git revision, and which tests they affect.
+
+    Changes to puppeteer modules are mapped to the changed symbols, and the
+    names of those are propagated to all puppeteer symbols referring to them.
+    A test is affected if it uses one of the affected names, including those
+    used by :class:`~testcase.FirefoxTestCase` for all tests, or if one of the
+    changed symbols has been traced while running the test. Changes to test
+    files, their resources, or manifests affect those tests directly. Changes
+    to the harness or the core puppeteer modules affect all tests.
+
+    :param rev: The git revision to compare with
+    :param index: The :class:`UsageIndex` to use
+    """
+
+    def __init__(self, rev, index):
+        self.rev = rev
+        self.index = index
+
+        # Reason why all tests are affected, if that's the case
+        self.all_reason = None
+
+        self.changed_symbols = set()
+        self.changed_manifests = []
+        self.changed_resources = []
+        self.changed_tests = set()
+        self.affected_names = set()
+
+        root = get_git_root()
+        for filepath, lines in get_changed_lines(rev, root).items():
+            self._add_change(filepath, lines, root)
+            if self.all_reason:
+                return
+
+        self._propagate()
+
+    def _add_change(self, filepath, lines, root):
+        if filepath.startswith(here + os.sep) or filepath in core_modules:
+            if filepath.endswith('.py'):
+                self.all_reason = 'changed %s' % os.path.relpath(filepath, root)
+
+        elif is_library(filepath):
+            if lines is None:
+                self.all_reason = 'removed %s' % os.path.relpath(filepath, root)
+                return
+
+            module = os.path.relpath(filepath, firefox_puppeteer.root)
+            symbols = self.index.get_symbols(filepath)
+            for lineno in lines:
+                name = find_symbol(symbols, lineno)
+                if not name:
+                    # Module-level code affects all symbols of the module
+                    self.changed_symbols.update('%s:%s' % (module, s[0])
+                                                for s in symbols if s[0])
+                else:
+                    self.changed_symbols.add('%s:%s' % (module, name))
+
+        elif filepath.startswith(firefox_ui_tests.resources + os.sep):
+            resource = os.path.relpath(filepath, firefox_ui_tests.resources)
+            self.changed_resources.append(resource.replace(os.sep, '/'))
+
+        elif filepath.endswith('.ini'):
+            self.changed_manifests.append(os.path.dirname(filepath))
+
+        else:
+            self.changed_tests.add(filepath)
+
+    def _propagate(self):
+        """Propagates the affected names through all puppeteer symbols."""
+        affected = set(s.split(':')[1].split('.')[-1] for s in self.changed_symbols)
+
+        modules = [os.path.join(dirpath, name)
+                   for dirpath, dirnames, filenames in os.walk(firefox_puppeteer.root)
+                   for name in filenames
+                   if is_library(os.path.join(dirpath, name))]
+        symbols = [symbol for module in modules for symbol in self.index.get_symbols(module)]
+
+        while True:
+            count = len(affected)
+            for name, start, end, refs in symbols:
+                if name and affected.intersection(refs):
+                    affected.add(name.split('.')[-1])
+            if len(affected) == count:
+                break
+
+        self.affected_names = affected
+
+        # Names used by the test case class apply to all tests
+        if affected.intersection(self.index.get_usage(testcase_module)['names']):
+            self.all_reason = 'changed puppeteer code used by each test'
+
+    def affects(self, filepath):
+        """Checks if the given test is affected by the changes.
+
+        :param filepath: Path of the test file
+        """
+        if self.all_reason:
+            return True
+
+        filepath = os.path.abspath(filepath)
+        if filepath in self.changed_tests:
+            return True
+
+        if any(filepath.startswith(path + os.sep) for path in self.changed_manifests):
+            return True
+
+        usage = self.index.get_usage(filepath)
+        if (self.affected_names.intersection(usage['names']) or
+                self.changed_symbols.intersection(usage['traced'])):
+            return True
+
+        return any(resource.startswith(s.rstrip('?')) or s.startswith(resource)
+                   for resource in self.changed_resources for s in usage['strings'])
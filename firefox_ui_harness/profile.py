@@ -0,0 +1,152 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import hashlib
+import json
+import os
+import shutil
+import socket
+import tempfile
+
+import mozfile
+import mozversion
+from marionette import Marionette
+from marionette.errors import MarionetteException
+from marionette.geckoinstance import GeckoInstance
+from mozprofile import Profile
+
+from .sharding import get_free_port
+
+
+class ProfileTemplate(object):
+    """A profile which gets built only once per build of Firefox and set of
+    preferences, and which is copied for each Firefox instance to start.
+
+    Building the template applies all preferences and launches Firefox once,
+    so that files usually created during the first start of a profile (e.g.
+    the startup cache and the databases) already exist in each copy.
+
+    :param binary: Path to the Firefox binary
+    :param prefs: Preferences to apply to the profile
+    :param cache_dir: Directory to store the templates in
+    """
+
+    # Files which must not be copied over from the template
+    lock_files = ['lock', '.parentlock', 'parent.lock']
+
+    def __init__(self, binary, prefs, cache_dir):
+        self.binary = binary
+        self.cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+
+        self.prefs = dict(GeckoInstance.required_prefs)
+        self.prefs.update(prefs or {})
+
+        self._path = None
+
+    @property
+    def build_id(self):
+        """Returns the build id of the Firefox binary."""
+        info = mozversion.get_version(binary=self.binary)
+        return info.get('application_buildid') or 'unknown'
+
+    @property
+    def path(self):
+        """Returns the location of the template, which depends on the build id
+        and the preferences."""
+        if self._path is None:
+            prefs_hash = hashlib.sha1(json.dumps(self.prefs, sort_keys=True)).hexdigest()
+            self._path = os.path.join(self.cache_dir,
+                                      '%s-%s' % (self.build_id, prefs_hash[:12]))
+        return self._path
+
+    def build(self):
+        """Builds the template unless it already exists.
+
+        The template is built in a temporary folder which gets renamed once
+        done, so concurrent runs never use an incomplete template.
+
+        :returns: The location of the template
+        """
+        if os.path.isdir(self.path):
+            return self.path
+
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        tmp_path = tempfile.mkdtemp(dir=self.cache_dir, suffix='.tmp')
+        try:
+            Profile(profile=tmp_path, preferences=self.prefs, restore=False)
+            self._warm_up(tmp_path)
+
+            for name in self.lock_files:
+                mozfile.remove(os.path.join(tmp_path, name))
+
+            os.rename(tmp_path, self.path)
+        except OSError:
+            # Another process has finished building the template first
+            if not os.path.isdir(self.path):
+                raise
+        finally:
+            mozfile.remove(tmp_path)
+
+        return self.path
+
+    def _warm_up(self, path):
+        """Launches Firefox once with the given profile and quits it cleanly,
+        so the startup cache gets written."""
+        port = get_free_port()
+        profile = Profile(profile=path,
+                          preferences={'marionette.defaultPrefs.port': port},
+                          restore=False)
+
+        fd, gecko_log = tempfile.mkstemp(suffix='.log')
+        os.close(fd)
+
+        instance = GeckoInstance(host='localhost', port=port, bin=self.binary,
+                                 profile=profile, gecko_log=gecko_log)
+        instance.start()
+        try:
+            marionette = Marionette(host='localhost', port=port)
+            marionette.wait_for_port()
+            marionette.start_session()
+            marionette.set_context(marionette.CONTEXT_CHROME)
+            try:
+                marionette.execute_script("""
+                  Services.startup.quit(Ci.nsIAppStartup.eAttemptQuit);
+                """)
+            except (socket.error, MarionetteException, IOError):
+                # The connection gets dropped while Firefox shuts down
+                pass
+            instance.runner.wait(timeout=60)
+        finally:
+            instance.close()
+            mozfile.remove(gecko_log)
+
+    def instantiate(self, port):
+        """Creates a copy of the template for a single Firefox instance.
+
+        The copy is placed in shared memory if available, which saves the
+        disk I/O of the Firefox instance.
+
+        The files are fully copied. Hardlinks are not used given that Firefox
+        modifies files like the SQLite databases in place, which would corrupt
+        the template, and reflinks can't be made from the disk to the shared
+        memory.
+
+        :param port: Marionette port to use for this instance
+
+        :returns: :class:`~mozprofile.Profile` instance for the copy
+        """
+        root = tempfile.gettempdir()
+        if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+            root = '/dev/shm'
+
+        path = tempfile.mkdtemp(dir=root, prefix='firefox-ui-profile-')
+        os.rmdir(path)
+
+        shutil.copytree(self.build(), path, symlinks=True)
+
+        return Profile(profile=path,
+                       preferences={'marionette.defaultPrefs.port': port},
+                       restore=False)
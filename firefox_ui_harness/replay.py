@@ -0,0 +1,283 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import bisect
+import gzip
+import json
+import sys
+
+from marionette.errors import ErrorCodes
+
+from .tracer import CommandTracer, NO_API, NO_TEST
+
+
+# Version of the recording format
+VERSION = 1
+
+# Placeholder for the URL of the resource server, which changes between runs
+BASEURL = '{baseurl}/'
+
+# Parameters which don't influence the response, but change between runs
+# or with unrelated code changes
+ignored_parameters = ('filename', 'line')
+
+# Prefixes of the commands which only retrieve the state of the browser
+read_only_prefixes = ('get', 'find', 'is')
+
+
+def read_recording(path):
+    """Reads a recorded session.
+
+    :returns: List of `[test, API, request, response]` entries
+    """
+    with gzip.open(path, 'rb') as f:
+        header = json.loads(f.readline())
+        if header.get('version') != VERSION:
+            raise ValueError('Unsupported version of recording %s: %s' %
+                             (path, header.get('version')))
+        return [json.loads(line) for line in f]
+
+
+def write_recording(path, entries):
+    """Writes a session as compressed file with one JSON entry per line."""
+    with gzip.open(path, 'wb') as f:
+        f.write(json.dumps({'version': VERSION}) + '\n')
+        for entry in entries:
+            f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+
+
+def changes_state(command):
+    """Returns whether the given command may change the state of the
+    browser, as opposed to only retrieving it."""
+    return not command.startswith(read_only_prefixes)
+
+
+def get_key(request):
+    """Returns the key to look up the recorded responses for a request."""
+    parameters = dict((k, v) for (k, v) in request.get('parameters', {}).items()
+                      if k not in ignored_parameters)
+    return json.dumps([request['name'], parameters], sort_keys=True)
+
+
+class SessionRecorder(CommandTracer):
+    """Command tracer which additionally keeps the full request and response
+    of each Marionette command, so that the session can be replayed by
+    :class:`SessionReplay`.
+
+    The URL of the resource server gets replaced by a placeholder, which
+    requires `baseurl` to be set once the server has been started.
+    """
+
+    def __init__(self):
+        CommandTracer.__init__(self)
+        self.messages = []
+        self.baseurl = None
+
+    def reset(self):
+        CommandTracer.reset(self)
+        self.messages = []
+
+    def trace(self, msg, response, duration, frame):
+        api = CommandTracer.trace(self, msg, response, duration, frame)
+
+        # Messages to the root actor are part of connecting to the server
+        if msg.get('to') != 'root':
+            request = {'name': msg['name'], 'parameters': msg.get('parameters', {})}
+            self.messages.append([self.test or NO_TEST, api or NO_API,
+                                  self._strip_baseurl(request),
+                                  self._strip_baseurl(response)])
+        return api
+
+    def _strip_baseurl(self, data):
+        if not self.baseurl:
+            return data
+        return json.loads(json.dumps(data).replace(self.baseurl, BASEURL))
+
+    def save(self, path):
+        write_recording(path, self.messages)
+
+
+class ReplayTransport(object):
+    """Stand-in for :class:`MarionetteTransport`, which answers all
+    commands with the responses of a recorded session.
+
+    :param replay: The :class:`SessionReplay` which provides the responses
+    """
+
+    def __init__(self, replay):
+        self.replay = replay
+        self.sock = None
+        self.actor = 'replay'
+
+    def connect(self):
+        pass
+
+    def send(self, msg):
+        return self.replay.respond(msg)
+
+    def close(self):
+        pass
+
+
+class RecordedTest(object):
+    """The commands recorded for a single test, in the order they have been
+    sent."""
+
+    def __init__(self):
+        self.responses = []
+
+        # Maps each key to the positions of its responses
+        self.positions = {}
+
+    def add(self, key, response):
+        self.positions.setdefault(key, []).append(len(self.responses))
+        self.responses.append(response)
+
+
+class SessionReplay(CommandTracer):
+    """Replays a session recorded by :class:`SessionRecorder`, without a
+    browser attached, and traces the commands sent during the replay.
+
+    The responses of each test are looked up in the order they have been
+    recorded, by the name and parameters of the command:
+
+    * If the command is the next one recorded, its response is used.
+    * Additional commands get the response of the last identical command
+      again, if no command which may change the state of the browser has
+      been sent since.
+    * Otherwise the next recorded response for the command is used, and all
+      recorded commands before it are skipped. If there is none, the last
+      recorded response is used again.
+
+    Commands which have never been recorded fail with an error.
+
+    :param path: Path of the recorded session
+    """
+
+    def __init__(self, path):
+        CommandTracer.__init__(self)
+        self.path = path
+        self.baseurl = None
+        self.unmatched = []
+
+        self._tests = {}
+        self._latest = {}
+        self._recorded = CommandTracer()
+
+        for test, api, request, response in read_recording(path):
+            key = get_key(request)
+            recorded = self._tests.setdefault(test, RecordedTest())
+            recorded.add(key, response)
+            self._latest[key] = response
+
+            self._recorded.start_test(test)
+            self._recorded.add(request['name'], api, 0, 0, 0.0)
+
+        self.reset()
+
+    def install(self):
+        # The replay transport traces the commands itself
+        pass
+
+    def uninstall(self):
+        pass
+
+    def reset(self):
+        CommandTracer.reset(self)
+        self.unmatched = []
+
+        # Position of the next recorded command per test
+        self._cursors = {}
+
+        # Number of commands sent so far which changed the browser state,
+        # and its value when the last response for each key was returned
+        self._state = 0
+        self._replayed = {}
+
+    def attach(self, marionette):
+        """Lets the given Marionette instance talk to the recorded session
+        instead of a browser."""
+        marionette.client = ReplayTransport(self)
+        marionette.wait_for_port = lambda timeout=60: True
+
+    def respond(self, msg):
+        """Returns the recorded response for the given message."""
+        test = self.test or NO_TEST
+        request = {'name': msg['name'], 'parameters': msg.get('parameters', {})}
+        if self.baseurl:
+            request = json.loads(json.dumps(request).replace(self.baseurl, BASEURL))
+
+        response = self._lookup(test, get_key(request))
+        if changes_state(msg['name']):
+            self._state += 1
+
+        if response is None:
+            self.unmatched.append((test, msg['name']))
+            response = {'error': {'status': ErrorCodes.UNKNOWN_ERROR,
+                                  'message': 'No recorded response for %s' % msg['name'],
+                                  'stacktrace': None}}
+        elif self.baseurl:
+            response = json.loads(json.dumps(response).replace(BASEURL, self.baseurl))
+
+        self.trace(msg, response, 0.0, sys._getframe(1))
+        return response
+
+    def _lookup(self, test, key):
+        recorded = self._tests.get(test)
+        positions = recorded.positions.get(key) if recorded else None
+        if not positions:
+            return self._latest.get(key)
+
+        cursor = self._cursors.get(test, 0)
+        index = bisect.bisect_left(positions, cursor)
+        replayed = self._replayed.get((test, key))
+
+        if index < len(positions) and positions[index] == cursor:
+            self._cursors[test] = cursor + 1
+            response = recorded.responses[cursor]
+        elif replayed and replayed[1] == self._state:
+            # Nothing has changed since the same command has been sent
+            response = replayed[0]
+        elif index < len(positions):
+            self._cursors[test] = positions[index] + 1
+            response = recorded.responses[positions[index]]
+        else:
+            response = recorded.responses[positions[-1]]
+
+        self._replayed[(test, key)] = (response, self._state)
+        return response
+
+    def get_deltas(self, index):
+        """Returns the round trips per test (`index` 0) or per API (`index` 1)
+        of the recording and the replay, for those with different counts.
+
+        :returns: Dictionary which maps the names to `(recorded, replayed)`
+        """
+        recorded = self._recorded._aggregate(index)
+        replayed = self._aggregate(index)
+
+        deltas = {}
+        for name in set(recorded) | set(replayed):
+            counts = (recorded.get(name, {}).get('commands', 0),
+                      replayed.get(name, {}).get('commands', 0))
+            if counts[0] != counts[1]:
+                deltas[name] = counts
+        return deltas
+
+    def format_deltas(self):
+        """Formats tables of the tests and the puppeteer APIs which need a
+        different number of round trips than in the recorded session.
+
+        :returns: List of lines
+        """
+        lines = ['%-10s%-10s%-8s%s' % ('recorded', 'replayed', 'delta', 'test / api')]
+        for index in (0, 1):
+            deltas = self.get_deltas(index)
+            names = sorted(deltas, key=lambda name: deltas[name][1] - deltas[name][0],
+                           reverse=True)
+            for name in names:
+                recorded, replayed = deltas[name]
+                lines.append('%-10d%-10d%-+8d%s' % (recorded, replayed,
+                                                    replayed - recorded, name))
+        return lines
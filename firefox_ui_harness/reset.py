@@ -0,0 +1,99 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from marionette import Wait
+from mozlog.structured.structuredlog import get_default_logger
+
+
+class SessionReset(object):
+    """Brings the browser back into its initial state after a test, so that
+    the same Marionette session can be used by the next test.
+
+    The reset closes all chrome windows and tabs which have been opened by the
+    test, restores modified preferences, and clears the session history as
+    well as the location bar of the remaining browser window.
+
+    If the reset fails, the session is not reused, and `needs_restart` is set
+    so the test runner can restart the browser before the next test file.
+    """
+
+    def __init__(self):
+        self.needs_restart = False
+        self.session_id = None
+        self.window_handle = None
+
+    def track(self, marionette, window_handle):
+        """Remembers the initial browser window of a new session.
+
+        :param marionette: The Marionette instance used by the test
+        :param window_handle: Handle of the browser window to keep open
+        """
+        if marionette.session_id != self.session_id:
+            self.session_id = marionette.session_id
+            self.window_handle = window_handle
+
+    def reset(self, testcase):
+        """Resets the browser state which has been modified by the test.
+
+        :param testcase: The :class:`~testcase.FirefoxTestCase` which has
+         been run
+
+        :returns: `True` if the session can be reused by the next test
+        """
+        marionette = testcase.marionette
+        if (marionette is None or marionette.session is None or
+                marionette.session_id != self.session_id):
+            return False
+
+        try:
+            self._close_windows(marionette)
+
+            marionette.set_context(marionette.CONTEXT_CHROME)
+            marionette.execute_script("""
+              for (let i = gBrowser.tabs.length - 1; i > 0; i--) {
+                gBrowser.removeTab(gBrowser.tabs[i]);
+              }
+              gBrowser.selectedTab = gBrowser.tabs[0];
+            """)
+
+            with marionette.using_context(marionette.CONTEXT_CONTENT):
+                marionette.navigate('about:blank')
+
+            marionette.execute_script("""
+              let history = gBrowser.sessionHistory;
+              if (history.count) {
+                history.PurgeHistory(history.count);
+              }
+
+              gURLBar.closePopup();
+              gURLBar.value = '';
+              gURLBar.handleRevert();
+            """)
+
+            testcase.prefs.restore_all_prefs()
+
+            marionette.set_context(marionette.CONTEXT_CONTENT)
+        except Exception:
+            get_default_logger().warning('Failed to reset the browser state, '
+                                         'the browser will be restarted',
+                                         exc_info=True)
+            self.needs_restart = True
+            return False
+
+        return True
+
+    def _close_windows(self, marionette):
+        handles = marionette.chrome_window_handles
+        if self.window_handle not in handles:
+            raise Exception('The initial browser window has been closed')
+
+        # Windows of any type can be left over, so don't use the puppeteer
+        # windows library which only knows about browser windows.
+        for handle in handles:
+            if handle != self.window_handle:
+                marionette.switch_to_window(handle)
+                marionette.close_chrome_window()
+
+        marionette.switch_to_window(self.window_handle)
+        Wait(marionette).until(lambda m: len(m.chrome_window_handles) == 1)
@@ -3,15 +3,32 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import copy
+import os
+import socket
 import sys
+import time
 
-from marionette import BaseMarionetteTestRunner
+import mozfile
+import moznetwork
+import mozversion
+from manifestparser import TestManifest
+from marionette import BaseMarionetteTestRunner, Marionette
+from marionette.errors import MarionetteException
 from marionette.runtests import cli
 
 import firefox_ui_tests
 
+from . import sharding
 from .arguments import ReleaseTestParser
+from .durations import DurationHistory
+from .impact import ChangeSet, UsageIndex, UsageTracer
+from .profile import ProfileTemplate
+from .replay import SessionRecorder, SessionReplay
+from .reset import SessionReset
+from .server import ResourceServer
 from .testcase import FirefoxTestCase
+from .timing import PhaseTimer
+from .tracer import CommandTracer
 
 
 class ReleaseTestRunner(BaseMarionetteTestRunner):
@@ -28,9 +45,409 @@ class ReleaseTestRunner(BaseMarionetteTestRunner):
         extra_prefs.update(prefs)
         kwargs['prefs'] = extra_prefs
 
+        # Keep the arguments around so that each shard can create its own runner.
+        # The tests are chunked by this process, so shards must not chunk again.
+        self.runner_kwargs = dict((k, v) for (k, v) in kwargs.items()
+                                  if k not in ('logger', 'shards', 'durations_file',
+                                               'changed_since', 'usage_index',
+                                               'total_chunks', 'this_chunk'))
+
+        self.shards = kwargs.pop('shards', 1)
+        self.marionette_port = kwargs.pop('marionette_port', None)
+        self.durations_file = kwargs.pop('durations_file', None)
+        self.reuse_session = kwargs.pop('reuse_session', False)
+        self.profile_cache = kwargs.pop('profile_cache', None)
+        self.changed_since = kwargs.pop('changed_since', None)
+        self.usage_index = kwargs.pop('usage_index', None)
+        self.trace_usage = kwargs.pop('trace_usage', False)
+        self.trace_commands = kwargs.pop('trace_commands', None)
+        self.record = kwargs.pop('record', None)
+        self.replay = kwargs.pop('replay', None)
+        self.test_durations = {}
+
+        self.change_set = None
+        self.traced_calls = {}
+
+        self.profile_template = None
+        self.profile_instance = None
+        if self.profile_cache and kwargs.get('binary'):
+            self.profile_template = ProfileTemplate(kwargs['binary'], kwargs['prefs'],
+                                                    self.profile_cache)
+
         BaseMarionetteTestRunner.__init__(self, *args, **kwargs)
         self.test_handlers = [FirefoxTestCase]
 
+        # Whether to log the summaries and write the reports of the run.
+        # Shards leave that to the parent process.
+        self.report_results = True
+
+        self.phase_timer = PhaseTimer()
+        self.test_kwargs['phase_timer'] = self.phase_timer
+        self.test_kwargs['logger'] = self.logger
+
+        # Recording and replaying a session also traces the commands
+        self.command_tracer = None
+        if self.record:
+            self.command_tracer = SessionRecorder()
+        elif self.replay:
+            self.command_tracer = SessionReplay(self.replay)
+        elif self.trace_commands:
+            self.command_tracer = CommandTracer()
+
+        if self.command_tracer:
+            self.test_kwargs['command_tracer'] = self.command_tracer
+
+        self.session_reset = None
+        if self.reuse_session:
+            self.session_reset = SessionReset()
+            self.test_kwargs['session_reset'] = self.session_reset
+
+    def _build_kwargs(self):
+        kwargs = BaseMarionetteTestRunner._build_kwargs(self)
+
+        if self.bin and self.marionette_port:
+            kwargs['port'] = self.marionette_port
+
+        if self.bin and self.profile_template:
+            self.logger.info('Using profile template %s' % self.profile_template.build())
+            self.profile_instance = self.profile_template.instantiate(kwargs['port'])
+            kwargs['profile'] = self.profile_instance
+
+        return kwargs
+
+    def start_marionette(self):
+        if not self.replay:
+            return BaseMarionetteTestRunner.start_marionette(self)
+
+        # No browser is needed to replay a recorded session
+        self.marionette = Marionette(timeout=self.timeout)
+        self.command_tracer.attach(self.marionette)
+
+    def start_httpd(self, need_external_ip):
+        if not os.path.isdir(self.server_root):
+            # The server root is the URL of an already running server
+            BaseMarionetteTestRunner.start_httpd(self, need_external_ip)
+        else:
+            host = moznetwork.get_ip() if need_external_ip else '127.0.0.1'
+            self.httpd = ResourceServer(self.server_root, host=host)
+            self.httpd.start()
+
+            self.marionette.baseurl = self.httpd.url
+            self.logger.info('running webserver on %s' % self.marionette.baseurl)
+
+        if self.record or self.replay:
+            # Recorded URLs have to be independent of the port of the server
+            self.command_tracer.baseurl = self.marionette.baseurl
+
+    @property
+    def restart_tests(self):
+        """Paths of all tests which request a browser restart via their
+        manifest."""
+        return set(test['filepath'] for test in self.tests if test.get('restart'))
+
+    def add_test(self, test, expected='pass', test_container=None):
+        BaseMarionetteTestRunner.add_test(self, test, expected, test_container)
+
+        if self.change_set:
+            self.skip_unaffected_tests()
+
+        filepath = os.path.abspath(test)
+        if os.path.splitext(filepath)[1] != '.ini':
+            return
+
+        # Remember which tests want to run in a freshly started browser
+        manifest = TestManifest()
+        manifest.read(filepath)
+        restart = set(os.path.abspath(entry['path']) for entry in manifest.tests
+                      if entry.get('restart', 'false').lower() == 'true')
+        for entry in self.tests:
+            if entry['filepath'] in restart:
+                entry['restart'] = True
+
+    def skip_unaffected_tests(self):
+        """Moves all tests which are not affected by the changes since the
+        revision given by `--changed-since` to the skipped tests."""
+        for entry in list(self.tests):
+            if not self.change_set.affects(entry['filepath']):
+                self.tests.remove(entry)
+                self.manifest_skipped_tests.append({
+                    'name': os.path.basename(entry['filepath']),
+                    'path': entry['filepath'],
+                    'disabled': 'not affected by changes since %s' % self.changed_since,
+                })
+
+    def restart_browser(self):
+        """Restarts the Firefox instance with the same profile.
+
+        The Marionette session will be started again by the next test.
+        """
+        if self.session_reset:
+            self.session_reset.needs_restart = False
+
+        if self.marionette.session is not None:
+            try:
+                self.marionette.delete_session()
+            except (socket.error, MarionetteException, IOError):
+                self.marionette.session = None
+                self.marionette.session_id = None
+                self.marionette.client.close()
+
+        if not self.marionette.instance:
+            self.logger.warning('Unable to restart a browser which has not been '
+                                'started by the test runner')
+            return
+
+        self.logger.info('Restarting the browser')
+        self.marionette.instance.restart(clean=False)
+        assert self.marionette.wait_for_port(), 'Timed out waiting for port!'
+
+    def run_test(self, filepath, expected, test_container):
+        if filepath in self.restart_tests:
+            self.restart_browser()
+
+        start_time = time.time()
+        try:
+            if self.trace_usage:
+                with UsageTracer() as tracer:
+                    BaseMarionetteTestRunner.run_test(self, filepath, expected,
+                                                      test_container)
+                self.traced_calls[filepath] = list(tracer.calls)
+            else:
+                BaseMarionetteTestRunner.run_test(self, filepath, expected, test_container)
+        finally:
+            self.test_durations[filepath] = time.time() - start_time
+
+        if self.session_reset and self.session_reset.needs_restart:
+            self.restart_browser()
+
+    def run_test_sets(self):
+        if self.change_set and not self.tests:
+            self.logger.info('No tests are affected by the changes since %s' %
+                             self.changed_since)
+            return
+
+        BaseMarionetteTestRunner.run_test_sets(self)
+
+    def run_tests(self, tests):
+        self.test_durations = {}
+        self.traced_calls = {}
+
+        if self.changed_since:
+            index = UsageIndex(self.usage_index)
+            self.change_set = ChangeSet(self.changed_since, index)
+            if self.change_set.all_reason:
+                self.logger.info('Running all tests, because of %s' %
+                                 self.change_set.all_reason)
+
+        self.phase_timer.results = []
+        self.phase_timer.install()
+        if self.command_tracer:
+            self.command_tracer.reset()
+            self.command_tracer.install()
+
+        try:
+            if self.shards > 1:
+                self.run_sharded_tests(tests)
+            else:
+                BaseMarionetteTestRunner.run_tests(self, tests)
+        finally:
+            self.phase_timer.uninstall()
+            if self.command_tracer:
+                self.command_tracer.uninstall()
+            if self.profile_instance:
+                mozfile.remove(self.profile_instance.profile)
+                self.profile_instance = None
+
+        self.save_test_durations()
+        self.save_usage_index()
+
+        if self.report_results:
+            self.report_phase_timings()
+            self.report_commands()
+            self.report_session()
+
+    def report_phase_timings(self):
+        """Logs the tests which spent the most time waiting and sleeping."""
+        if not self.phase_timer.results:
+            return
+
+        self.logger.info('\nWASTED WAIT TIME\n-------')
+        for line in self.phase_timer.format_summary():
+            self.logger.info(line)
+
+    def report_commands(self):
+        """Logs the puppeteer APIs which sent the most Marionette commands,
+        and writes the full report of the command tracer."""
+        if not self.trace_commands or not self.command_tracer.stats:
+            return
+
+        self.logger.info('\nMARIONETTE COMMANDS\n-------')
+        for line in self.command_tracer.format_summary():
+            self.logger.info(line)
+
+        try:
+            self.command_tracer.write_report(self.trace_commands)
+            self.logger.info('Wrote command trace to %s' % self.trace_commands)
+        except (IOError, OSError) as e:
+            self.logger.warning('Failed to write the command trace to %s: %s' %
+                                (self.trace_commands, e))
+
+    def report_session(self):
+        """Saves the recorded session, or logs the tests and puppeteer APIs
+        which needed a different number of round trips than the replayed
+        session."""
+        if self.record:
+            try:
+                self.command_tracer.save(self.record)
+                self.logger.info('Recorded %d Marionette commands to %s' %
+                                 (len(self.command_tracer.messages), self.record))
+            except (IOError, OSError) as e:
+                self.logger.warning('Failed to save the recorded session to %s: %s' %
+                                    (self.record, e))
+
+        elif self.replay:
+            self.logger.info('\nROUND TRIPS COMPARED TO %s\n-------' % self.replay)
+            lines = self.command_tracer.format_deltas()
+            if len(lines) == 1:
+                self.logger.info('Same number of round trips for all tests and APIs')
+            else:
+                for line in lines:
+                    self.logger.info(line)
+
+            for test, command in self.command_tracer.unmatched:
+                self.logger.warning('No recorded response for %s in %s' % (command, test))
+
+    def save_test_durations(self):
+        """Adds the durations of the tests which have been run to the
+        duration history, if a durations file has been specified."""
+        if not self.durations_file or not self.test_durations:
+            return
+
+        try:
+            history = DurationHistory(self.durations_file)
+            history.update(self.test_durations)
+            history.save()
+        except (IOError, OSError) as e:
+            self.logger.warning('Failed to save test durations to %s: %s' %
+                                (self.durations_file, e))
+
+    def save_usage_index(self):
+        """Stores the traced calls of the tests which have been run, and the
+        updated entries of the usage index."""
+        if not self.usage_index or not (self.change_set or self.traced_calls):
+            return
+
+        try:
+            index = self.change_set.index if self.change_set else UsageIndex(self.usage_index)
+            for filepath, calls in self.traced_calls.items():
+                index.add_traced(filepath, calls)
+            index.save()
+        except (IOError, OSError) as e:
+            self.logger.warning('Failed to save the usage index to %s: %s' %
+                                (self.usage_index, e))
+
+    def _run_shards(self):
+        """Splits the tests into shards, runs them, and collects the results
+        of all shards."""
+        if self.durations_file:
+            history = DurationHistory(self.durations_file)
+            shards = sharding.split_by_duration(self.tests, self.shards, history)
+        else:
+            shards = sharding.split_round_robin(self.tests, self.shards)
+
+        if self.profile_template:
+            # Build the template once before the shards are racing for it
+            self.logger.info('Using profile template %s' % self.profile_template.build())
+
+        self.logger.info('Running %d tests in %d shards' % (len(self.tests), len(shards)))
+
+        # All shards share a single server for the resources
+        runner_kwargs = dict(self.runner_kwargs)
+        if os.path.isdir(self.server_root):
+            self.httpd = ResourceServer(self.server_root)
+            self.httpd.start()
+            runner_kwargs['server_root'] = self.httpd.url
+            self.logger.info('running webserver on %s' % self.httpd.url)
+
+        try:
+            results = sharding.run_shards(self.__class__, runner_kwargs,
+                                          shards, self.logger)
+        finally:
+            if self.httpd:
+                self.httpd.stop()
+                self.httpd = None
+
+        for result in results:
+            self.passed += result['passed']
+            self.failed += result['failed']
+            self.todo += result['todo']
+            self.failures.extend(result['failures'])
+            self.test_durations.update(result['durations'])
+            self.traced_calls.update(result['traced'])
+            self.phase_timer.results.extend(result['timings'])
+            if self.command_tracer:
+                self.command_tracer.merge(result['commands'])
+
+    def run_sharded_tests(self, tests):
+        """Runs the tests split across multiple Firefox instances in parallel.
+
+        The manifests are resolved in this process, and the resulting list of
+        tests gets split into shards. Each shard is run by its own test runner
+        in a worker process, and all log entries are merged into the stream of
+        this runner's logger.
+
+        :param tests: List of test files, directories, or manifests
+        """
+        self.reset_test_stats()
+        self.start_time = time.time()
+
+        # Resolving manifests needs the device and application name, which
+        # would otherwise be retrieved from a browser session.
+        self._device = 'desktop'
+        self._appName = 'Firefox'
+
+        for test in tests:
+            self.add_test(test)
+
+        if not self.tests and not self.change_set:
+            raise Exception('There are no tests to run.')
+
+        if self.total_chunks > 1:
+            self.tests = sharding.split_round_robin(self.tests,
+                                                    self.total_chunks)[self.this_chunk - 1]
+
+        version_info = mozversion.get_version(binary=self.bin,
+                                              sources=self.sources,
+                                              dm_type=os.environ.get('DM_TRANS', 'adb'))
+        self.logger.suite_start(self.tests, version_info=version_info)
+
+        for test in self.manifest_skipped_tests:
+            name = os.path.basename(test['path'])
+            self.logger.test_start(name)
+            self.logger.test_end(name, 'SKIP', message=test['disabled'])
+            self.todo += 1
+
+        if self.tests:
+            self._run_shards()
+        else:
+            self.logger.info('No tests are affected by the changes since %s' %
+                             self.changed_since)
+
+        self.logger.info('\nSUMMARY\n-------')
+        self.logger.info('passed: %d' % self.passed)
+        self.logger.info('failed: %d' % self.failed)
+        self.logger.info('todo: %d' % self.todo)
+
+        if self.failed > 0:
+            self.logger.info('\nFAILED TESTS\n-------')
+            for failed_test in self.failures:
+                self.logger.info('%s' % failed_test[0])
+
+        self.end_time = time.time()
+        self.elapsedtime = self.end_time - self.start_time
+
+        self.logger.suite_end()
+
 
 def run():
     cli(runner_class=ReleaseTestRunner, parser_class=ReleaseTestParser)
@@ -0,0 +1,170 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import hashlib
+import mimetypes
+import os
+import posixpath
+import threading
+import urllib
+import urlparse
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+
+class Resource(object):
+    """A file of the document root held in memory.
+
+    :param path: Path of the file on disk
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = f.read()
+
+        self.content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if self.content_type.startswith('text/'):
+            self.content_type += '; charset=utf-8'
+
+        self.etag = '"%s"' % hashlib.sha1(self.data).hexdigest()[:16]
+
+
+class ResourceRequestHandler(BaseHTTPRequestHandler):
+    """Serves the resources of the server from memory.
+
+    HTTP/1.1 is used so that Firefox keeps the connection alive across
+    requests. Each response carries an ETag, so revalidating a page which
+    is already cached by Firefox results in an empty `304` response.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.send_resource(include_body=True)
+
+    def do_HEAD(self):
+        self.send_resource(include_body=False)
+
+    def send_resource(self, include_body):
+        resource = self.server.get_resource(urlparse.urlsplit(self.path).path)
+        if resource is None:
+            self.send_data(404, 'text/plain', 'Not Found', include_body)
+            return
+
+        if self.headers.get('If-None-Match') == resource.etag:
+            self.send_response(304)
+            self.send_header('ETag', resource.etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_data(200, resource.content_type, resource.data, include_body,
+                       etag=resource.etag)
+
+    def send_data(self, code, content_type, data, include_body, etag=None):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        # Let Firefox revalidate each time, so tests never see stale content
+        self.send_header('Cache-Control', 'no-cache')
+        if etag:
+            self.send_header('ETag', etag)
+        self.end_headers()
+
+        if include_body:
+            self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        # Don't spam stderr with a line for each request
+        pass
+
+
+class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, docroot):
+        HTTPServer.__init__(self, address, ResourceRequestHandler)
+
+        self.docroot = os.path.abspath(docroot)
+        self.resources = {}
+        self.lock = threading.Lock()
+
+    def preload(self):
+        """Reads all files of the document root into memory."""
+        for dirpath, dirnames, filenames in os.walk(self.docroot):
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                url_path = os.path.relpath(path, self.docroot).replace(os.sep, '/')
+                self.resources[url_path] = Resource(path)
+
+    def get_resource(self, url_path):
+        """Returns the resource for the given URL path, or `None` if there
+        is no such file in the document root.
+
+        Files which have not been preloaded are read on first access.
+        """
+        url_path = posixpath.normpath(urllib.unquote(url_path)).lstrip('/')
+        if url_path == '.':
+            url_path = ''
+        elif url_path.startswith('..'):
+            return None
+
+        resource = self.resources.get(url_path)
+        if resource is None:
+            path = os.path.join(self.docroot, *url_path.split('/'))
+            if os.path.isdir(path):
+                return self.get_resource(posixpath.join(url_path, 'index.html'))
+            if not os.path.isfile(path):
+                return None
+
+            with self.lock:
+                resource = self.resources.setdefault(url_path, Resource(path))
+
+        return resource
+
+
+class ResourceServer(object):
+    """Multi-threaded HTTP server for the resources of the tests.
+
+    All files of the document root are preloaded into memory when the server
+    gets started, so serving a page never touches the disk. The server can be
+    shared by several test runners, e.g. by all shards of a test run.
+
+    :param docroot: Folder with the files to serve
+    :param host: Host to bind the server to
+    :param port: Port to bind the server to. If `0`, a free port is used.
+    """
+
+    def __init__(self, docroot, host='127.0.0.1', port=0):
+        self.docroot = docroot
+        self.host = host
+        self.port = port
+
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        """The base URL of the server, to be used as server root."""
+        return 'http://%s:%d/' % (self.host, self.httpd.server_port)
+
+    def start(self):
+        """Preloads the resources, and starts serving them in a background
+        thread."""
+        self.httpd = ThreadedHTTPServer((self.host, self.port), self.docroot)
+        self.httpd.preload()
+
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        if self.httpd:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.thread.join()
+
+            self.httpd = None
+            self.thread = None
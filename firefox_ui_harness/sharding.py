@@ -0,0 +1,236 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import heapq
+import multiprocessing
+import os
+import socket
+import threading
+import traceback
+
+from mozlog.structured.structuredlog import StructuredLogger, set_default_logger
+
+
+class QueueHandler(object):
+    """Structured log handler which forwards all log entries of a shard to a
+    queue, so that the parent process can merge them into one result stream.
+
+    :param queue: The queue to put the log entries into
+    :param shard: Index of the shard, which gets added to each entry
+    """
+
+    def __init__(self, queue, shard):
+        self.queue = queue
+        self.shard = shard
+
+    def __call__(self, data):
+        data = dict(data)
+        data['shard'] = self.shard
+        self.queue.put(data)
+
+
+class LogForwarder(threading.Thread):
+    """Thread which reads log entries of all shards from a queue and emits them
+    via the logger of the parent process.
+
+    The `suite_start` and `suite_end` entries of the shards are dropped, given
+    that the parent process reports a single suite for all the shards.
+
+    :param logger: The structured logger of the parent process
+    :param queue: The queue the shards are writing their log entries to
+    """
+
+    def __init__(self, logger, queue):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.logger = logger
+        self.queue = queue
+
+    def run(self):
+        while True:
+            data = self.queue.get()
+            if data is None:
+                break
+
+            if data['action'] in ('suite_start', 'suite_end'):
+                continue
+
+            self.logger.log_raw(data)
+
+
+def get_free_port(host='localhost'):
+    """Returns a port on the given host which is currently not in use."""
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+    finally:
+        s.close()
+
+
+def get_shard_path(path, index):
+    """Returns a variant of the given log or report path for the given shard.
+
+    :param path: Path to a file or a directory
+    :param index: Index of the shard
+    """
+    if os.path.isdir(path):
+        return os.path.join(path, 'gecko-shard-%d.log' % index)
+
+    root, ext = os.path.splitext(path)
+    return '%s-shard-%d%s' % (root, index, ext)
+
+
+def split_round_robin(tests, count):
+    """Splits the tests into the given number of shards in round-robin order.
+
+    :param tests: List of tests as collected by the test runner
+    :param count: Number of shards to create
+
+    :returns: List of non-empty lists of tests
+    """
+    shards = [[] for i in range(count)]
+    for index, test in enumerate(tests):
+        shards[index % count].append(test)
+
+    return [shard for shard in shards if shard]
+
+
+def split_by_duration(tests, count, history):
+    """Splits the tests into the given number of shards, so that all shards
+    take about the same time to run.
+
+    Tests are assigned longest-first to the shard with the least amount of
+    work so far. Tests without a recorded duration get the estimate of the
+    history, and are scheduled before all known tests. That way a wrong
+    estimate can still be compensated by the remaining tests.
+
+    :param tests: List of tests as collected by the test runner
+    :param count: Number of shards to create
+    :param history: The :class:`~durations.DurationHistory` to take the
+     durations from
+
+    :returns: List of non-empty lists of tests
+    """
+    estimate = history.estimate
+
+    def sort_key(test):
+        duration = history.get(test['filepath'])
+        if duration is None:
+            return (0, -estimate)
+        return (1, -duration)
+
+    # Heap of (total duration, index) tuples to find the least busy shard
+    loads = [(0.0, index) for index in range(count)]
+    shards = [[] for i in range(count)]
+
+    for test in sorted(tests, key=sort_key):
+        duration = history.get(test['filepath'])
+        total, index = heapq.heappop(loads)
+        shards[index].append(test)
+        heapq.heappush(loads, (total + (estimate if duration is None else duration), index))
+
+    return [shard for shard in shards if shard]
+
+
+def run_shard(args):
+    """Runs the tests of a single shard in a worker process.
+
+    Each shard creates its own test runner, which starts its own Firefox
+    instance with a fresh profile and a free Marionette port. The resources
+    are served by the HTTP server of the parent process.
+
+    :param args: Tuple of the runner class, the keyword arguments for the
+     runner, the index of the shard, the tests to run, and the queue to send
+     log entries to
+
+    :returns: Dictionary with the test statistics of the shard
+    """
+    runner_class, runner_kwargs, index, tests, queue = args
+
+    logger = StructuredLogger('firefox-ui-tests-shard-%d' % index)
+    logger.add_handler(QueueHandler(queue, index))
+    set_default_logger(logger)
+
+    kwargs = dict(runner_kwargs)
+    kwargs['logger'] = logger
+    kwargs['marionette_port'] = get_free_port()
+
+    gecko_log = kwargs.get('gecko_log')
+    if gecko_log != '-':
+        kwargs['gecko_log'] = get_shard_path(gecko_log or 'gecko.log', index)
+    if kwargs.get('xml_output'):
+        kwargs['xml_output'] = get_shard_path(kwargs['xml_output'], index)
+
+    result = {
+        'index': index,
+        'passed': 0,
+        'failed': 0,
+        'todo': 0,
+        'failures': [],
+        'durations': {},
+        'traced': {},
+        'timings': [],
+        'commands': [],
+    }
+
+    try:
+        runner = runner_class(**kwargs)
+        runner.report_results = False
+
+        # Tests have already been collected from the manifests by the parent
+        # process, so only hand over the tests of this shard.
+        runner.tests = tests
+        runner.run_tests([])
+
+        result.update({
+            'passed': runner.passed,
+            'failed': runner.failed,
+            'todo': runner.todo,
+            'failures': runner.failures,
+            'durations': runner.test_durations,
+            'traced': runner.traced_calls,
+            'timings': runner.phase_timer.results,
+            'commands': (runner.command_tracer.entries()
+                         if runner.command_tracer else []),
+        })
+    except Exception:
+        logger.error('Shard %d failed to run its tests' % index, exc_info=True)
+        result['failed'] += 1
+        result['failures'].append(('shard %d' % index, traceback.format_exc(),
+                                   'TEST-UNEXPECTED-FAIL'))
+
+    return result
+
+
+def run_shards(runner_class, runner_kwargs, shards, logger):
+    """Runs all shards in parallel by using a pool of worker processes.
+
+    Log entries of all shards are merged into the stream of the given logger
+    while the tests are running.
+
+    :param runner_class: The test runner class to use for each shard
+    :param runner_kwargs: Keyword arguments to create the test runner with
+    :param shards: List of test lists, one for each shard
+    :param logger: The structured logger of the parent process
+
+    :returns: List of test statistics as returned by :func:`run_shard`
+    """
+    manager = multiprocessing.Manager()
+    queue = manager.Queue()
+
+    forwarder = LogForwarder(logger, queue)
+    forwarder.start()
+
+    pool = multiprocessing.Pool(processes=len(shards))
+    try:
+        return pool.map(run_shard, [(runner_class, runner_kwargs, index, tests, queue)
+                                    for index, tests in enumerate(shards)])
+    finally:
+        pool.close()
+        pool.join()
+
+        queue.put(None)
+        forwarder.join()
+        manager.shutdown()
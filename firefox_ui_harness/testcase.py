@@ -2,6 +2,8 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import time
+
 from marionette import MarionetteTestCase
 
 from firefox_puppeteer import Puppeteer
@@ -13,8 +15,37 @@ class FirefoxTestCase(MarionetteTestCase, Puppeteer):
     libraries are exposed to test scope.
     """
     def __init__(self, *args, **kwargs):
+        self.session_reset = kwargs.pop('session_reset', None)
+        self.phase_timer = kwargs.pop('phase_timer', None)
+        self.command_tracer = kwargs.pop('command_tracer', None)
+        logger = kwargs.pop('logger', None)
         MarionetteTestCase.__init__(self, *args, **kwargs)
 
+        # Use the logger of the runner, because a default logger doesn't have
+        # to be set
+        if logger:
+            self.logger = logger
+
+        if self.phase_timer:
+            # Wrap the phases of this instance only, so that overridden
+            # methods of subclasses are measured as a whole.
+            self.setUp = self.phase_timer.wrap('setUp', self.setUp)
+            self.tearDown = self.phase_timer.wrap('tearDown', self.tearDown)
+            setattr(self, self._testMethodName,
+                    self.phase_timer.wrap('body', getattr(self, self._testMethodName)))
+
+    def run(self, result=None):
+        if self.phase_timer:
+            self.phase_timer.start_test(self.id())
+        if self.command_tracer:
+            self.command_tracer.start_test(self.id())
+
+        try:
+            return MarionetteTestCase.run(self, result)
+        finally:
+            if self.command_tracer:
+                self.command_tracer.stop_test()
+
     def setUp(self, *args, **kwargs):
         MarionetteTestCase.setUp(self, *args, **kwargs)
         Puppeteer.set_marionette(self, self.marionette)
@@ -23,6 +54,9 @@ class FirefoxTestCase(MarionetteTestCase, Puppeteer):
         self.marionette.set_context('chrome')
         self.browser = self.windows.current
 
+        if self.session_reset:
+            self.session_reset.track(self.marionette, self.browser.handle)
+
     def tearDown(self, *args, **kwargs):
         try:
             # Marionette needs an existent window to be selected. Take the first
@@ -44,3 +78,38 @@ class FirefoxTestCase(MarionetteTestCase, Puppeteer):
                              (self._start_handle_count, win_count))
         finally:
             MarionetteTestCase.tearDown(self, *args, **kwargs)
+
+    def cleanTest(self):
+        if self.phase_timer:
+            self.log_phase_timings()
+
+        # Keep the session for the next test if the browser state can be reset
+        if self.session_reset is None or not self.session_reset.reset(self):
+            return MarionetteTestCase.cleanTest(self)
+
+        self.duration = time.time() - self.start_time
+        try:
+            self.loglines.extend(self.marionette.get_logs())
+        except Exception as e:
+            self.loglines = [['Error getting log: %s' % e]]
+        self.marionette = None
+
+    def log_phase_timings(self):
+        """Logs the time spent in each phase of the test, with the durations
+        in seconds as `phases` field of the log entry."""
+        timings = self.phase_timer.stop_test()
+        if not timings:
+            return
+
+        phases = dict((phase, round(timings[phase], 3))
+                      for phase in self.phase_timer.phases)
+        message = ', '.join('%s: %.2fs' % (phase, timings[phase])
+                            for phase in self.phase_timer.phases)
+
+        self.logger.log_raw({
+            'action': 'log',
+            'level': 'INFO',
+            'message': 'Phase timings of %s: %s' % (timings['test'], message),
+            'test': timings['test'],
+            'phases': phases,
+        })
@@ -0,0 +1,74 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from firefox_ui_harness.impact import get_changed_lines, verify_revision
+
+
+class TestChangedLines(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.git('init', '-q')
+        self.write('tracked.py', 'a = 1\nb = 2\n')
+        self.write('.gitignore', 'ignored.py\n')
+        self.git('add', 'tracked.py', '.gitignore')
+        self.git('-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                 'commit', '-q', '-m', 'initial')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def git(self, *args):
+        subprocess.check_call(('git',) + args, cwd=self.root)
+
+    def write(self, name, content):
+        with open(os.path.join(self.root, name), 'w') as f:
+            f.write(content)
+
+    def test_untracked_files(self):
+        self.write('tracked.py', 'a = 1\nb = 3\n')
+        self.write('untracked.py', 'c = 1\nd = 2\ne = 3\n')
+        self.write('ignored.py', 'f = 1\n')
+
+        changes = get_changed_lines('HEAD', self.root)
+        self.assertEqual(changes, {
+            os.path.join(self.root, 'tracked.py'): set([2]),
+            os.path.join(self.root, 'untracked.py'): set([1, 2, 3]),
+        })
+
+    def test_special_paths(self):
+        self.write('with space.py', 'a = 1\n')
+        self.write('with"quote.py', 'b = 1\n')
+        self.write('removed file.py', 'c = 1\n')
+        self.git('add', 'with space.py', 'with"quote.py', 'removed file.py')
+        self.git('-c', 'user.name=test', '-c', 'user.email=test@example.com',
+                 'commit', '-q', '-m', 'special paths')
+
+        self.write('with space.py', 'a = 2\n')
+        self.write('with"quote.py', 'b = 2\n')
+        os.remove(os.path.join(self.root, 'removed file.py'))
+
+        changes = get_changed_lines('HEAD', self.root)
+        self.assertEqual(changes, {
+            os.path.join(self.root, 'with space.py'): set([1]),
+            os.path.join(self.root, 'with"quote.py'): set([1]),
+            os.path.join(self.root, 'removed file.py'): None,
+        })
+
+
+class TestVerifyRevision(unittest.TestCase):
+
+    def test_revisions(self):
+        self.assertIsNone(verify_revision('HEAD'))
+        self.assertIn('Unknown git revision', verify_revision('no-such-revision'))
+
+
+if __name__ == '__main__':
+    unittest.main()
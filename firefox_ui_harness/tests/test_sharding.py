@@ -0,0 +1,74 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import marionette.runner.base
+from mozlog.structured import structuredlog
+
+import firefox_ui_harness.runtests
+from firefox_ui_harness.fakeserver import FakeBrowser, FakeMarionetteServer
+from firefox_ui_harness.runtests import ReleaseTestRunner
+
+
+TEST_FILE = """
+from firefox_ui_harness.testcase import FirefoxTestCase
+
+
+class TestShard(FirefoxTestCase):
+
+    def test_pass(self):
+        pass
+"""
+
+
+def get_version(**kwargs):
+    # There is no binary to retrieve the version from
+    return {}
+
+
+class TestShardedChunks(unittest.TestCase):
+
+    def setUp(self):
+        browser = FakeBrowser()
+        browser.register_script("log('", lambda session, args: None)
+        self.server = FakeMarionetteServer(browser)
+        self.server.start()
+
+        self.tests_dir = tempfile.mkdtemp()
+        for index in range(5):
+            with open(os.path.join(self.tests_dir, 'test_%d.py' % index), 'w') as f:
+                f.write(TEST_FILE)
+
+        self.get_versions = (firefox_ui_harness.runtests.mozversion.get_version,
+                             marionette.runner.base.mozversion.get_version)
+        firefox_ui_harness.runtests.mozversion.get_version = get_version
+        marionette.runner.base.mozversion.get_version = get_version
+
+    def tearDown(self):
+        (firefox_ui_harness.runtests.mozversion.get_version,
+         marionette.runner.base.mozversion.get_version) = self.get_versions
+
+        shutil.rmtree(self.tests_dir)
+        self.server.stop()
+
+    def run_chunk(self, this_chunk):
+        runner = ReleaseTestRunner(address='localhost:%d' % self.server.port,
+                                   logger=structuredlog.StructuredLogger('test_sharding'),
+                                   shards=2, total_chunks=2, this_chunk=this_chunk)
+        runner.run_tests([self.tests_dir])
+        return runner
+
+    def test_shards_with_chunks(self):
+        # Each test runs exactly once in one of the shards of its chunk
+        runners = [self.run_chunk(1), self.run_chunk(2)]
+        self.assertEqual([runner.passed for runner in runners], [3, 2])
+        self.assertEqual([runner.failed for runner in runners], [0, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
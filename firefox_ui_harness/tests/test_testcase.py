@@ -0,0 +1,65 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import marionette.runner.base
+from mozlog.structured import structuredlog
+
+import firefox_ui_harness.runtests
+from firefox_ui_harness.fakeserver import FakeBrowser, FakeMarionetteServer
+from firefox_ui_harness.runtests import ReleaseTestRunner
+
+from test_sharding import TEST_FILE, get_version
+
+
+class TestPhaseTimings(unittest.TestCase):
+
+    def setUp(self):
+        browser = FakeBrowser()
+        browser.register_script("log('", lambda session, args: None)
+        self.server = FakeMarionetteServer(browser)
+        self.server.start()
+
+        self.tests_dir = tempfile.mkdtemp()
+        with open(os.path.join(self.tests_dir, 'test_timings.py'), 'w') as f:
+            f.write(TEST_FILE)
+
+        self.get_versions = (firefox_ui_harness.runtests.mozversion.get_version,
+                             marionette.runner.base.mozversion.get_version)
+        firefox_ui_harness.runtests.mozversion.get_version = get_version
+        marionette.runner.base.mozversion.get_version = get_version
+
+        # Only the logger of the runner is known
+        self.default_logger_name = structuredlog._default_logger_name
+        structuredlog._default_logger_name = None
+
+    def tearDown(self):
+        structuredlog._default_logger_name = self.default_logger_name
+        (firefox_ui_harness.runtests.mozversion.get_version,
+         marionette.runner.base.mozversion.get_version) = self.get_versions
+
+        shutil.rmtree(self.tests_dir)
+        self.server.stop()
+
+    def test_logged_by_runner_logger(self):
+        entries = []
+        logger = structuredlog.StructuredLogger('test_timings')
+        logger.add_handler(entries.append)
+
+        runner = ReleaseTestRunner(address='localhost:%d' % self.server.port,
+                                   logger=logger)
+        runner.run_tests([self.tests_dir])
+
+        self.assertEqual((runner.passed, runner.failed), (1, 0))
+        timings = [entry for entry in entries if 'phases' in entry]
+        self.assertEqual(len(timings), 1)
+        self.assertEqual(set(timings[0]['phases']), set(runner.phase_timer.phases))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+
+from marionette import Marionette
+
+from firefox_puppeteer import Puppeteer
+from firefox_ui_harness.fakeserver import FakeBrowser, FakeMarionetteServer
+from firefox_ui_harness.tracer import CommandTracer
+
+
+class TestCommandTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeMarionetteServer(FakeBrowser())
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+        self.marionette = Marionette(host='localhost', port=self.server.port)
+        self.marionette.start_session()
+        self.addCleanup(self.marionette.delete_session)
+
+        self.puppeteer = Puppeteer()
+        self.puppeteer.set_marionette(self.marionette)
+
+        self.tracer = CommandTracer()
+        self.tracer.install()
+        self.addCleanup(self.tracer.uninstall)
+
+    def get_apis(self, command):
+        return set(api for test, api, name, count, sent, received, duration
+                   in self.tracer.entries() if name == command)
+
+    def test_context_changes(self):
+        self.puppeteer.prefs.get_pref('browser.startup.homepage')
+        self.assertEqual(self.get_apis('getContext'), set(['Preferences.get_pref']))
+        self.assertEqual(self.get_apis('setContext'), set(['Preferences.get_pref']))
+
+        window = self.puppeteer.windows.current
+        self.tracer.reset()
+        window.is_private
+        self.assertEqual(self.get_apis('setContext'),
+                         set(['BrowserWindow.is_private']))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from marionette.wait import Wait
+
+
+class PhaseTimer(object):
+    """Measures how long each test spends in its phases.
+
+    Besides `setUp`, the test method (`body`) and `tearDown`, the time spent
+    in :func:`Wait.until` (`wait`) and in :func:`time.sleep` (`sleep`) is
+    recorded. Sleeps which happen while waiting only count as waiting time.
+    Only calls from the thread which installed the timer are measured.
+
+    The timer has to be installed before the time spent waiting or sleeping
+    can be measured, which patches both functions.
+    """
+
+    phases = ['setUp', 'body', 'tearDown', 'wait', 'sleep']
+
+    # Modules which may have imported `sleep` from the time module
+    patched_packages = ('firefox_puppeteer', 'firefox_ui_tests', 'firefox_ui_harness')
+
+    def __init__(self):
+        self.results = []
+
+        self._current = None
+        self._waiting = False
+        self._originals = None
+        self._thread = None
+
+    def install(self):
+        """Patches :func:`Wait.until` and :func:`time.sleep` to measure the
+        time spent in those."""
+        if self._originals:
+            return
+
+        until = Wait.until
+        sleep = time.sleep
+        self._originals = (until, sleep)
+        self._thread = threading.current_thread()
+
+        timer = self
+
+        @wraps(until)
+        def timed_until(self, *args, **kwargs):
+            if timer._waiting or threading.current_thread() is not timer._thread:
+                return until(self, *args, **kwargs)
+
+            timer._waiting = True
+            try:
+                with timer.phase('wait'):
+                    return until(self, *args, **kwargs)
+            finally:
+                timer._waiting = False
+
+        @wraps(sleep)
+        def timed_sleep(seconds):
+            if timer._waiting or threading.current_thread() is not timer._thread:
+                return sleep(seconds)
+
+            with timer.phase('sleep'):
+                return sleep(seconds)
+
+        Wait.until = timed_until
+        self._patch_sleep(sleep, timed_sleep)
+
+    def uninstall(self):
+        """Restores the original functions."""
+        if not self._originals:
+            return
+
+        until, sleep = self._originals
+        Wait.until = until
+        self._patch_sleep(time.sleep, sleep)
+        self._originals = None
+
+    def _patch_sleep(self, old, new):
+        time.sleep = new
+
+        # Modules which did `from time import sleep` keep their own reference
+        for name, module in sys.modules.items():
+            if module and name.startswith(self.patched_packages):
+                if getattr(module, 'sleep', None) is old:
+                    module.sleep = new
+
+    def start_test(self, test_id):
+        """Starts recording the timings of the given test."""
+        self._current = {'test': test_id}
+        self._current.update((phase, 0.0) for phase in self.phases)
+
+    def stop_test(self):
+        """Stops recording the timings of the current test.
+
+        :returns: Dictionary with the duration of each phase in seconds, and
+         the id of the `test`
+        """
+        timings, self._current = self._current, None
+        if timings:
+            self.results.append(timings)
+        return timings
+
+    @contextmanager
+    def phase(self, name):
+        """Context manager to add the time spent in its block to the given
+        phase of the current test."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            if self._current is not None:
+                self._current[name] += time.time() - start
+
+    def wrap(self, name, func):
+        """Returns a wrapper for the given function which adds the time spent
+        in it to the given phase."""
+        @wraps(func)
+        def timed(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+        return timed
+
+    def format_summary(self, count=10):
+        """Formats a table of the tests which spent the most time waiting
+        and sleeping.
+
+        :param count: Number of tests to list
+
+        :returns: List of lines
+        """
+        results = sorted(self.results, key=lambda r: r['wait'] + r['sleep'], reverse=True)
+
+        columns = self.phases + ['wasted']
+        lines = ['%-10s' * len(columns) % tuple(columns) + 'test']
+        for result in results[:count]:
+            durations = [result[phase] for phase in self.phases]
+            durations.append(result['wait'] + result['sleep'])
+            lines.append('%-10.2f' * len(durations) % tuple(durations) + result['test'])
+
+        return lines
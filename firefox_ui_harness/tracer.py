@@ -0,0 +1,204 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+import os
+import sys
+import time
+from functools import wraps
+
+from marionette_transport import MarionetteTransport
+
+import firefox_puppeteer
+
+from .impact import is_library
+
+
+# Name used for commands which are not sent by any puppeteer API
+NO_API = '(marionette)'
+
+# Name used for commands which are sent outside of a test
+NO_TEST = '(harness)'
+
+
+def get_api_name(frame):
+    """Returns the name of the innermost puppeteer API the given frame is
+    part of, or `None`.
+
+    Lambdas, comprehensions, and private helpers are attributed to the
+    public method or property which calls them.
+    """
+    while frame:
+        code = frame.f_code
+        name = code.co_name
+        if (is_library(code.co_filename) and not name.startswith('<') and
+                not (name.startswith('_') and not name.startswith('__'))):
+            return _get_qualified_name(frame)
+        frame = frame.f_back
+
+    return None
+
+
+def _get_qualified_name(frame):
+    code = frame.f_code
+    instance = frame.f_locals.get('self')
+
+    if instance is not None:
+        # Use the class which defines the method, not the one of the instance
+        for cls in type(instance).__mro__:
+            attr = cls.__dict__.get(code.co_name)
+            func = getattr(attr, 'fget', attr)
+            func = getattr(func, '__func__', func)
+            if getattr(func, '__code__', None) is code:
+                return '%s.%s' % (cls.__name__, code.co_name)
+        return '%s.%s' % (type(instance).__name__, code.co_name)
+
+    module = os.path.splitext(os.path.relpath(code.co_filename, firefox_puppeteer.root))[0]
+    return '%s.%s' % (module.replace(os.sep, '.'), code.co_name)
+
+
+class CommandTracer(object):
+    """Counts the Marionette commands sent, together with the bytes and the
+    time spent for each, and attributes them to the current test and the
+    innermost puppeteer API which caused them.
+
+    The tracer has to be installed, which wraps the `send` method of all
+    Marionette transports. Commands which are not sent from within a
+    puppeteer API are attributed to `(marionette)`.
+
+    The size of a response is measured by serializing it again, which can
+    slightly differ from the size of the message on the wire.
+    """
+
+    def __init__(self):
+        # Maps (test, API, command) to [count, bytes sent, bytes received, seconds]
+        self.stats = {}
+        self.test = None
+
+        self._original_send = None
+
+    def install(self):
+        """Wraps :func:`MarionetteTransport.send` to trace all commands."""
+        if self._original_send:
+            return
+
+        send = self._original_send = MarionetteTransport.send
+        tracer = self
+
+        @wraps(send)
+        def traced_send(self, msg):
+            start = time.time()
+            response = send(self, msg)
+            tracer.trace(msg, response, time.time() - start, sys._getframe(1))
+            return response
+
+        MarionetteTransport.send = traced_send
+
+    def uninstall(self):
+        if self._original_send:
+            MarionetteTransport.send = self._original_send
+            self._original_send = None
+
+    def reset(self):
+        """Removes all records."""
+        self.stats = {}
+
+    def start_test(self, test_id):
+        self.test = test_id
+
+    def stop_test(self):
+        self.test = None
+
+    def trace(self, msg, response, duration, frame):
+        """Records a command which has been sent.
+
+        :param msg: The message sent to the server
+        :param response: The response of the server
+        :param duration: Round-trip time in seconds
+        :param frame: Stack frame which sent the command
+
+        :returns: Name of the puppeteer API which sent the command, or `None`
+        """
+        api = get_api_name(frame)
+        self.add(msg.get('name'), api, len(json.dumps(msg)), len(json.dumps(response)),
+                 duration)
+        return api
+
+    def add(self, command, api, sent, received, duration):
+        """Records a single command.
+
+        :param command: Name of the Marionette command
+        :param api: Name of the puppeteer API which sent the command
+        :param sent: Number of bytes sent
+        :param received: Number of bytes received
+        :param duration: Round-trip time in seconds
+        """
+        key = (self.test or NO_TEST, api or NO_API, command)
+        entry = self.stats.setdefault(key, [0, 0, 0, 0.0])
+        entry[0] += 1
+        entry[1] += sent
+        entry[2] += received
+        entry[3] += duration
+
+    def merge(self, entries):
+        """Adds the entries of another tracer, as returned by :func:`entries`."""
+        for test, api, command, count, sent, received, duration in entries:
+            entry = self.stats.setdefault((test, api, command), [0, 0, 0, 0.0])
+            entry[0] += count
+            entry[1] += sent
+            entry[2] += received
+            entry[3] += duration
+
+    def entries(self):
+        """Returns all records as list of `(test, API, command, count, bytes
+        sent, bytes received, seconds)` tuples."""
+        return [key + tuple(value) for key, value in sorted(self.stats.items())]
+
+    def _aggregate(self, index):
+        totals = {}
+        for key, (count, sent, received, duration) in self.stats.items():
+            total = totals.setdefault(key[index], {
+                'commands': 0,
+                'bytes_sent': 0,
+                'bytes_received': 0,
+                'duration': 0.0,
+                'by_command': {},
+            })
+            total['commands'] += count
+            total['bytes_sent'] += sent
+            total['bytes_received'] += received
+            total['duration'] += duration
+            total['by_command'][key[2]] = total['by_command'].get(key[2], 0) + count
+        return totals
+
+    def get_report(self):
+        """Returns the report with the totals per test and per API."""
+        return {
+            'tests': self._aggregate(0),
+            'apis': self._aggregate(1),
+            'entries': self.entries(),
+        }
+
+    def write_report(self, path):
+        """Writes the report as JSON file."""
+        with open(path, 'w') as f:
+            json.dump(self.get_report(), f, indent=2, sort_keys=True)
+
+    def format_summary(self, count=10):
+        """Formats a table of the puppeteer APIs which sent the most commands.
+
+        :param count: Number of APIs to list
+
+        :returns: List of lines
+        """
+        apis = self._aggregate(1)
+        names = sorted(apis, key=lambda name: apis[name]['commands'], reverse=True)
+
+        lines = ['%-10s%-10s%-12s%-12s%s' % ('commands', 'seconds', 'sent', 'received', 'api')]
+        for name in names[:count]:
+            total = apis[name]
+            lines.append('%-10d%-10.2f%-12d%-12d%s' % (total['commands'], total['duration'],
+                                                       total['bytes_sent'],
+                                                       total['bytes_received'], name))
+        return lines
@@ -42,7 +42,8 @@ class TestAboutPrivateBrowsing(FirefoxTestCase):
             top_html.send_keys(self.keys.SHIFT, self.keys.ACCEL, access_key)
 
         self.wait_for_condition(lambda mn: len(self.windows.all) == 2)
-        self.browser_pb = self.windows.switch_to(lambda win: win.is_private)
+        self.browser_pb = self.windows.switch_to(lambda win: win.is_private,
+                                                 snapshot=True)
         self.assertTrue(self.browser_pb.is_private)
 
         with self.marionette.using_context('content'):
@@ -2,8 +2,6 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-import time
-
 from firefox_ui_harness.testcase import FirefoxTestCase
 
 
@@ -39,10 +37,8 @@ class TestBackForward(FirefoxTestCase):
         self.assertFalse(forward.is_displayed())
 
         for i in range(1, len(self.test_urls)):
-            back.click()
-
-            # TODO Implement something akin to waitForPageLoad
-            time.sleep(1)
+            self.browser.tabbar.wait_for_page_load(lambda tabbar: back.click(),
+                                                   url=self.test_urls[-(i + 1)])
 
             with self.marionette.using_context('content'):
                 self.assertEquals(self.marionette.get_url(),
@@ -55,10 +51,8 @@ class TestBackForward(FirefoxTestCase):
         self.assertTrue(forward.is_enabled())
 
         for i in range(1, len(self.test_urls)):
-            forward.click()
-
-            # TODO Implement something akin to waitForPageLoad
-            time.sleep(1)
+            self.browser.tabbar.wait_for_page_load(lambda tabbar: forward.click(),
+                                                   url=self.test_urls[i])
 
             with self.marionette.using_context('content'):
                 self.assertEquals(self.marionette.get_url(), self.test_urls[i])
@@ -2,8 +2,6 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-import time
-
 from firefox_ui_harness.testcase import FirefoxTestCase
 
 homepage_pref = 'browser.startup.homepage'
@@ -21,9 +19,8 @@ class TestHomeButton(FirefoxTestCase):
         FirefoxTestCase.tearDown(self)
 
     def test_home_button(self):
-        self.browser.navbar.home_button.click()
+        self.browser.tabbar.wait_for_page_load(
+            lambda tabbar: self.browser.navbar.home_button.click(), url=self.url)
 
-        # TODO wait_for_page_load
-        time.sleep(1)
         with self.marionette.using_context('content'):
             self.assertEquals(self.marionette.get_url(), self.url)
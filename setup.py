@@ -34,4 +34,5 @@ setup(name='firefox-ui-tests',
       entry_points="""
         [console_scripts]
         firefox-ui-tests = firefox_ui_harness:run
+        firefox-puppeteer-benchmarks = firefox_ui_harness.benchmarks:run
       """)